@@ -1,96 +1,374 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 import datetime
+import os
+import time
 from recommendation_system1 import RecommendationSystem1
 from find_leader import FindLeader
+from db_pool import DatabasePool
+from catalog_store import CatalogStore
+from cache import LRUCache
+from json_fragments import FragmentEncoder, RawJSON
+from metrics import REGISTRY
+
+RECOMMEND_LIMIT = 20
+MAX_BATCH_SIZE = 100
 
 class RecommendationAPI:
-    def __init__(self, recommendation_system, find_leader):
+    def __init__(self, recommendation_system, find_leader, metrics=None, fragment_cache_size=100000):
         self.recommendation_system = recommendation_system
         self.find_leader = find_leader
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.metrics.add_collector(self.collect_db_pool_metrics)
         self.app = Flask(__name__)
+        # 餐廳資料列 -> 已編碼的 JSON 片段；以整列內容為鍵，catalog 更新後的資料列自然對應到新片段
+        self.restaurant_fragments = LRUCache(maxsize=fragment_cache_size)
+        self.encoder = FragmentEncoder(lambda value: self.app.json.dumps(value, separators=(",", ":")))
+        self.metrics.add_collector(self.collect_fragment_metrics)
+        self.setup_instrumentation()
         self.setup_routes()
 
+    def collect_db_pool_metrics(self):
+        return [('recommender_db_pool', {'stat': name}, value)
+                for name, value in self.recommendation_system.db_pool.stats().items()]
+
+    def collect_fragment_metrics(self):
+        return [('recommender_json_fragments', {'stat': name}, value)
+                for name, value in self.restaurant_fragments.stats().items()]
+
+    def setup_instrumentation(self):
+        @self.app.before_request
+        def start_request_timer():
+            g.request_started = time.perf_counter()
+            # 帶 X-Profile: 1 的請求會在 Server-Timing 回應標頭中列出各階段耗時
+            g.profile = request.headers.get('X-Profile') == '1'
+            if g.profile:
+                self.metrics.start_profile()
+
+        @self.app.after_request
+        def record_request(response):
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            elapsed = time.perf_counter() - g.request_started
+            self.metrics.observe('recommender_request_seconds', elapsed, route=route)
+            self.metrics.increment('recommender_requests_total', route=route, status=response.status_code)
+
+            if g.get('profile'):
+                stages = self.metrics.stop_profile() + [('total', elapsed)]
+                response.headers['Server-Timing'] = ", ".join(
+                    f"{stage.replace('.', '-')};dur={seconds * 1000:.3f}" for stage, seconds in stages)
+            return response
+
+        @self.app.teardown_request
+        def clear_profile(exception):
+            # 未處理的例外會跳過 after_request，這裡確保執行緒上的 profile 一定被清除
+            if g.get('profile'):
+                self.metrics.stop_profile()
+
+    def parse_recommend_query(self, data):
+        """
+        Validate a /recommend request body and convert it into recommend_restaurants' arguments.
+
+        Raises:
+            ValueError: with the message returned to the client as a 400 error.
+        """
+        location = data.get('location')
+        cuisine_type = data.get('category')
+        price_range = data.get('price')
+        dining_day = data.get('dining_day')
+        dining_hour = data.get('dining_hour')
+        user_preferences = data.get('user_preferences')
+        offset = data.get('offset', 0)
+
+        if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+            raise ValueError("offset 應為非負整數")
+
+        if user_preferences is not None and (not isinstance(user_preferences, list)
+                                             or not all(isinstance(item, str) for item in user_preferences)):
+            raise ValueError("user_preferences 應為字串陣列")
+
+        if dining_day != -1:
+            if dining_day not in range(1, 8):
+                raise ValueError("1-7 的數字")
+
+            days_dict = {1: "一", 2: "二", 3: "三", 4: "四", 5: "五", 6: "六", 7: "日"}
+            dining_day = days_dict[dining_day]
+        else:
+            dining_day = None
+
+        if dining_hour:
+            try:
+                datetime.datetime.strptime(dining_hour, "%H:%M")
+            except (TypeError, ValueError):
+                raise ValueError("用餐時間格式應為 HH:MM")
+        else:
+            dining_hour = None
+
+        return {
+            'location': location,
+            'cuisine_type': cuisine_type,
+            'price_range': price_range,
+            'dining_day': dining_day,
+            'dining_hour': dining_hour,
+            'user_preferences': user_preferences,
+            'offset': offset,
+        }
+
+    def format_restaurant(self, restaurant):
+        return {
+            'name': restaurant[1],
+            'address': restaurant[2],
+            'category': restaurant[3],
+            'price': restaurant[4],
+            'opening_time': restaurant[5],
+            'rating': float(restaurant[6]),
+            'phone': restaurant[7]
+        }
+
+    def format_restaurants(self, restaurants):
+        """
+        Restaurants as RawJSON fragments, each row encoded only the first time it is returned.
+        """
+        fragments = []
+        for restaurant in restaurants:
+            fragment = self.restaurant_fragments.get(restaurant)
+            if fragment is None:
+                fragment = RawJSON(self.encoder.encode(self.format_restaurant(restaurant)))
+                self.restaurant_fragments.set(restaurant, fragment)
+            fragments.append(fragment)
+        return fragments
+
+    def encode_json(self, payload):
+        """
+        jsonify's response body for `payload`, which may contain RawJSON fragments.
+        """
+        return self.encoder.encode(payload) + b"\n"
+
+    # 以下 *_payload 方法回傳 (payload, status)，Flask 與 async serving mode 共用同一份 JSON 介面
+
+    def recommend_payload(self, data):
+        try:
+            query = self.parse_recommend_query(data)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        recommended_restaurants = self.recommendation_system.recommend_restaurants(
+            query['location'], query['cuisine_type'], query['price_range'], query['dining_day'],
+            query['dining_hour'], query['user_preferences'], limit=RECOMMEND_LIMIT, offset=query['offset'])
+
+        if recommended_restaurants:
+            return self.format_restaurants(recommended_restaurants), 200
+        else:
+            return {'message': "抱歉，沒有找到符合條件的餐廳。"}, 404
+
+    def recommend_batch_payload(self, data):
+        queries = data.get('queries')
+        if not isinstance(queries, list) or not queries:
+            return {'error': "queries 應為非空陣列"}, 400
+        if len(queries) > MAX_BATCH_SIZE:
+            return {'error': f"一次最多 {MAX_BATCH_SIZE} 筆查詢"}, 400
+
+        results = [None] * len(queries)
+        parsed = []
+        for number, query in enumerate(queries):
+            try:
+                if not isinstance(query, dict):
+                    raise ValueError("查詢格式錯誤")
+                parsed.append((number, self.parse_recommend_query(query)))
+            except ValueError as e:
+                results[number] = {'status': 400, 'error': str(e)}
+
+        batch = self.recommendation_system.recommend_restaurants_batch(
+            [query for _, query in parsed], limit=RECOMMEND_LIMIT)
+
+        for (number, _), (recommended_restaurants, error) in zip(parsed, batch):
+            if error is not None:
+                results[number] = {'status': 500, 'error': str(error)}
+            elif recommended_restaurants:
+                results[number] = {'status': 200, 'restaurants': self.format_restaurants(recommended_restaurants)}
+            else:
+                results[number] = {'status': 404, 'message': "抱歉，沒有找到符合條件的餐廳。"}
+
+        return {'results': results}, 200
+
+    def parse_leader_query(self, data):
+        """
+        Raises:
+            ValueError: when chatroom_id is missing.
+        """
+        chatroom_id = data.get('chatroom_id')
+        if not chatroom_id:
+            raise ValueError("chatroom_id is required")
+        return chatroom_id
+
+    def parse_leader_batch_query(self, data):
+        """
+        Raises:
+            ValueError: when chatroom_ids is missing or too long.
+        """
+        chatroom_ids = data.get('chatroom_ids')
+        if not isinstance(chatroom_ids, list) or not chatroom_ids or not all(chatroom_ids):
+            raise ValueError("chatroom_ids is required")
+        if len(chatroom_ids) > MAX_BATCH_SIZE:
+            raise ValueError(f"at most {MAX_BATCH_SIZE} chatroom_ids per request")
+        return chatroom_ids
+
+    def format_leader(self, result):
+        leader_id, top_3_preferences, opinion_weight = result
+        return {
+            "leader_id": leader_id,
+            "top_3_preferences": top_3_preferences,
+            "opinion_weight": opinion_weight
+        }
+
+    def format_leader_batch(self, batch):
+        results = []
+        for chatroom_id, result, error in batch:
+            if error is not None:
+                results.append({"chatroom_id": chatroom_id, "error": str(error)})
+            else:
+                results.append({"chatroom_id": chatroom_id, **self.format_leader(result)})
+        return {"results": results}
+
+    def parse_group_recommend_query(self, data):
+        """
+        Validate a /recommend/group body: chatroom_id plus /recommend's location, price and time filters.
+
+        Raises:
+            ValueError: with the message returned to the client as a 400 error.
+        """
+        query = self.parse_recommend_query(data)
+        query['chatroom_id'] = self.parse_leader_query(data)
+        return query
+
+    def group_recommend_payload(self, query, group):
+        """
+        Leader analysis and restaurants for a chatroom's members' preferences (`group`, from get_user_preference).
+        """
+        if group.empty:
+            return {"error": "chatroom has no members with preferences"}, 404
+
+        result, preference_vector = self.find_leader.group_profile(query['chatroom_id'], group)
+        recommended_restaurants = self.recommendation_system.recommend_for_group(
+            query['location'], query['price_range'], query['dining_day'], query['dining_hour'],
+            preference_vector, limit=RECOMMEND_LIMIT, offset=query['offset'])
+
+        payload = self.format_leader(result)
+        if recommended_restaurants:
+            payload['restaurants'] = self.format_restaurants(recommended_restaurants)
+            return payload, 200
+        else:
+            payload['message'] = "抱歉，沒有找到符合條件的餐廳。"
+            return payload, 404
+
+    def invalidate_leader_payload(self, data):
+        chatroom_id = (data or {}).get('chatroom_id')
+
+        # 未指定 chatroom_id 時清除全部快取
+        if chatroom_id:
+            removed = self.find_leader.invalidate_chatroom(chatroom_id)
+        else:
+            removed = len(self.find_leader.result_cache)
+            self.find_leader.clear_cache()
+
+        return {"invalidated": removed}, 200
+
+    def reload_catalog_payload(self):
+        snapshot = self.recommendation_system.reload_catalog()
+        return {"version": snapshot.version, "restaurants": len(snapshot)}, 200
+
+    def json_response(self, payload, status=200):
+        with self.metrics.timer('serialize'):
+            return Response(self.encode_json(payload), status=status, mimetype='application/json')
+
     def setup_routes(self):
         @self.app.route('/recommend', methods=['POST'])
         def recommend():
             if request.content_type != 'application/json':
                 return jsonify({'error': 'Content-Type must be application/json'}), 415
 
-            data = request.json
+            return self.json_response(*self.recommend_payload(request.json))
 
-            location = data.get('location')
-            cuisine_type = data.get('category')
-            price_range = data.get('price')
-            dining_day = data.get('dining_day')
-            dining_hour = data.get('dining_hour')
-            user_preferences = data.get('user_preferences')
+        @self.app.route('/recommend/batch', methods=['POST'])
+        def recommend_batch():
+            if request.content_type != 'application/json':
+                return jsonify({'error': 'Content-Type must be application/json'}), 415
 
-            if dining_day != -1:
+            return self.json_response(*self.recommend_batch_payload(request.json))
+
+        @self.app.route('/recommend/group', methods=['POST'])
+        def recommend_group():
+            if request.content_type != 'application/json':
+                return jsonify({'error': 'Content-Type must be application/json'}), 415
+
+            try:
                 try:
-                    if dining_day not in range(1, 8):
-                        raise ValueError("1-7 的數字")
+                    query = self.parse_group_recommend_query(request.json)
                 except ValueError as e:
                     return jsonify({'error': str(e)}), 400
 
-                days_dict = {1: "一", 2: "二", 3: "三", 4: "四", 5: "五", 6: "六", 7: "日"}
-                dining_day = days_dict[dining_day]
-            else:
-                dining_day = None
+                # 一次取得成員偏好，領導者分析與推薦共用同一份資料與 catalog snapshot
+                with self.metrics.timer('leader.fetch'):
+                    group = self.find_leader.get_user_preference(query['chatroom_id'])
+                return self.json_response(*self.group_recommend_payload(query, group))
 
-            if dining_hour:
-                try:
-                    datetime.datetime.strptime(dining_hour, "%H:%M")
-                except ValueError:
-                    return jsonify({'error': "用餐時間格式應為 HH:MM"}), 400
-            else:
-                dining_hour = None
-
-            recommended_restaurants = self.recommendation_system.recommend_restaurants(
-                location, cuisine_type, price_range, dining_day, dining_hour, user_preferences)
-
-            if len(recommended_restaurants) > 20:
-                recommended_restaurants = recommended_restaurants[:20]
-
-            if recommended_restaurants:
-                response = [
-                    {
-                        'name': restaurant[1],
-                        'address': restaurant[2],
-                        'category': restaurant[3],
-                        'price': restaurant[4],
-                        'opening_time': restaurant[5],
-                        'rating': float(restaurant[6]),
-                        'phone': restaurant[7]
-                    }
-                    for restaurant in recommended_restaurants
-                ]
-                return jsonify(response), 200
-            else:
-                return jsonify({'message': "抱歉，沒有找到符合條件的餐廳。"}), 404
+            except Exception as e:
+                return jsonify({"error": str(e)}), 500
+
+        @self.app.route('/recommend/cache-stats', methods=['GET'])
+        def recommend_cache_stats():
+            return jsonify(self.recommendation_system.response_cache_stats()), 200
 
         @self.app.route('/get-leader-preferences', methods=['POST'])
         def find_leader():
             try:
                 # 從 POST 請求中獲取 chatroom_id
                 data = request.get_json()
-                chatroom_id = data.get('chatroom_id')
+                try:
+                    chatroom_id = self.parse_leader_query(data)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
 
-                if not chatroom_id:
-                    return jsonify({"error": "chatroom_id is required"}), 400
+                # 調用主函數並返回結果
+                return self.json_response(self.format_leader(self.find_leader.main(chatroom_id)))
+
+            except Exception as e:
+                return jsonify({"error": str(e)}), 500
 
-                # 調用主函數
-                leader_id, top_3_preferences, opinion_weight = self.find_leader.main(chatroom_id)
+        @self.app.route('/get-leader-preferences/batch', methods=['POST'])
+        def find_leader_batch():
+            try:
+                data = request.get_json()
+                try:
+                    chatroom_ids = self.parse_leader_batch_query(data)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
 
-                # 返回結果
-                return jsonify({
-                    "leader_id": leader_id,
-                    "top_3_preferences": top_3_preferences,
-                    "opinion_weight": opinion_weight
-                })
+                return self.json_response(self.format_leader_batch(self.find_leader.main_batch(chatroom_ids)))
 
             except Exception as e:
                 return jsonify({"error": str(e)}), 500
 
+        @self.app.route('/get-leader-preferences/invalidate', methods=['POST'])
+        def invalidate_leader_preferences():
+            payload, status = self.invalidate_leader_payload(request.get_json(silent=True))
+            return jsonify(payload), status
+
+        @self.app.route('/get-leader-preferences/cache-stats', methods=['GET'])
+        def leader_cache_stats():
+            return jsonify(self.find_leader.result_cache.stats()), 200
+
+        @self.app.route('/catalog/reload', methods=['POST'])
+        def reload_catalog():
+            payload, status = self.reload_catalog_payload()
+            return jsonify(payload), status
+
+        @self.app.route('/metrics', methods=['GET'])
+        def metrics():
+            return Response(self.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+        @self.app.route('/db-pool/stats', methods=['GET'])
+        def db_pool_stats():
+            return jsonify(self.recommendation_system.db_pool.stats()), 200
+
     def run(self, host='0.0.0.0', port=5001):
         self.app.run(host=host, port=port)
 
@@ -103,8 +381,32 @@ if __name__ == '__main__':
         'port': ""
     }
     jieba_dict_path = './dict.txt.big'
+    jieba_cache_dir = './.jieba_cache'
 
-    recommendation_system = RecommendationSystem1(db_config, jieba_dict_path)
-    find_leader = FindLeader(db_config)
+    # 多個 worker 時：一個行程設 CATALOG_STORE 匯出 catalog，其餘再加上 CATALOG_FROM_STORE=1 直接映射
+    catalog_store_path = os.environ.get('CATALOG_STORE')
+    catalog_store = CatalogStore(catalog_store_path) if catalog_store_path else None
+    catalog_from_store = catalog_store is not None and os.environ.get('CATALOG_FROM_STORE') == '1'
+
+    # restaurant 表有最後修改時間欄位時設 CATALOG_UPDATED_AT_COLUMN，背景更新才會帶入既有餐廳的修改；
+    # 刪除（以及未設此欄位時的修改）靠每 CATALOG_FULL_RELOAD_EVERY 次更新一次的整表重載
+    updated_at_column = os.environ.get('CATALOG_UPDATED_AT_COLUMN') or None
+    catalog_full_reload_every = int(os.environ.get('CATALOG_FULL_RELOAD_EVERY', '10'))
+
+    db_pool = DatabasePool(db_config, minconn=1, maxconn=10)
+    recommendation_system = RecommendationSystem1(db_config, jieba_dict_path, jieba_cache_dir=jieba_cache_dir, db_pool=db_pool,
+                                                  updated_at_column=updated_at_column,
+                                                  catalog_full_reload_every=catalog_full_reload_every,
+                                                  catalog_store=catalog_store, catalog_from_store=catalog_from_store)
+    find_leader = FindLeader(db_config, db_pool=db_pool)
     recommendation_api = RecommendationAPI(recommendation_system, find_leader)
-    recommendation_api.run()
\ No newline at end of file
+
+    # SERVING_MODE=async 以 asyncio/ASGI 服務同樣的路由（需要 asyncpg 與 uvicorn）
+    if os.environ.get('SERVING_MODE') == 'async':
+        from async_app import AsyncRecommendationAPI
+        from async_db_pool import AsyncDatabasePool
+
+        async_db_pool = AsyncDatabasePool(db_config, minconn=1, maxconn=50)
+        AsyncRecommendationAPI(recommendation_api, async_db_pool).run()
+    else:
+        recommendation_api.run()
\ No newline at end of file
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class AsyncRequest:
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+        # 帶 X-Profile: 1 時收集各階段耗時，回傳於 Server-Timing 標頭
+        self.profile = [] if headers.get('x-profile') == '1' else None
+
+    @property
+    def content_type(self):
+        return self.headers.get('content-type')
+
+    def get_json(self):
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+
+class AsyncRecommendationAPI:
+    """
+    ASGI application serving RecommendationAPI's routes and JSON contract on asyncio.
+
+    Chatroom preferences are fetched with an AsyncDatabasePool so many round
+    trips can be in flight at once, while filtering, scoring and leader
+    analysis run on a thread pool (the numpy/scipy kernels release the GIL).
+    Without an async pool the leader routes fall back to the synchronous
+    FindLeader.main on the same thread pool.
+
+        uvicorn.run(AsyncRecommendationAPI(recommendation_api, AsyncDatabasePool(db_config)))
+    """
+
+    def __init__(self, api, async_db_pool=None, executor=None, max_workers=None):
+        """
+        Parameters:
+            api (RecommendationAPI): the Flask API whose handlers are reused.
+            async_db_pool (AsyncDatabasePool): Optional pool for async preference queries.
+            executor (Executor): Optional worker pool for CPU-bound work, a ThreadPoolExecutor by default.
+            max_workers (int): Size of the default ThreadPoolExecutor.
+        """
+        self.api = api
+        self.metrics = api.metrics
+        self.async_db_pool = async_db_pool
+        self.owns_executor = executor is None
+        self.executor = executor if executor is not None else ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='recommender-worker')
+
+        self.routes = {
+            ('POST', '/recommend'): self.recommend,
+            ('POST', '/recommend/batch'): self.recommend_batch,
+            ('POST', '/recommend/group'): self.recommend_group,
+            ('GET', '/recommend/cache-stats'): self.recommend_cache_stats,
+            ('POST', '/get-leader-preferences'): self.find_leader,
+            ('POST', '/get-leader-preferences/batch'): self.find_leader_batch,
+            ('POST', '/get-leader-preferences/invalidate'): self.invalidate_leader_preferences,
+            ('GET', '/get-leader-preferences/cache-stats'): self.leader_cache_stats,
+            ('POST', '/catalog/reload'): self.reload_catalog,
+            ('GET', '/metrics'): self.render_metrics,
+            ('GET', '/db-pool/stats'): self.db_pool_stats,
+        }
+        self.paths = {path for _, path in self.routes}
+
+        if async_db_pool is not None:
+            self.metrics.add_collector(self.collect_async_db_pool_metrics)
+
+    def collect_async_db_pool_metrics(self):
+        return [('recommender_async_db_pool', {'stat': name}, value)
+                for name, value in self.async_db_pool.stats().items()]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    if self.async_db_pool is not None:
+                        await self.async_db_pool.open()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def close(self):
+        if self.async_db_pool is not None:
+            await self.async_db_pool.close()
+        if self.owns_executor:
+            self.executor.shutdown(wait=False)
+
+    async def handle(self, scope, receive, send):
+        started = time.perf_counter()
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        request = AsyncRequest(scope['method'], scope['path'], headers, body)
+
+        handler = self.routes.get((request.method, request.path))
+        route = request.path if request.path in self.paths else 'unmatched'
+        if handler is not None:
+            try:
+                content, status, content_type = await handler(request)
+            except Exception as e:
+                content, status, content_type = self.json({"error": str(e)}, 500)
+        elif route != 'unmatched':
+            content, status, content_type = self.json({"error": "Method Not Allowed"}, 405)
+        else:
+            content, status, content_type = self.json({"error": "Not Found"}, 404)
+
+        elapsed = time.perf_counter() - started
+        self.metrics.observe('recommender_request_seconds', elapsed, route=route)
+        self.metrics.increment('recommender_requests_total', route=route, status=status)
+
+        response_headers = [(b'content-type', content_type.encode('latin-1')),
+                            (b'content-length', str(len(content)).encode('latin-1'))]
+        if request.profile is not None:
+            stages = request.profile + [('total', elapsed)]
+            server_timing = ", ".join(f"{stage.replace('.', '-')};dur={seconds * 1000:.3f}" for stage, seconds in stages)
+            response_headers.append((b'server-timing', server_timing.encode('latin-1')))
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def json(self, payload, status=200):
+        # 與 jsonify 相同的輸出，餐廳資料沿用已編碼的片段
+        return self.api.encode_json(payload), status, 'application/json'
+
+    def timed_json(self, request, payload, status=200):
+        with self.stage(request, 'serialize'):
+            return self.json(payload, status)
+
+    @contextmanager
+    def stage(self, request, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.observe('recommender_stage_seconds', elapsed, stage=name)
+            if request.profile is not None:
+                request.profile.append((name, elapsed))
+
+    async def run_in_worker(self, request, function, *args):
+        loop = asyncio.get_running_loop()
+        result, stages = await loop.run_in_executor(
+            self.executor, self._profiled, request.profile is not None, function, args)
+        if request.profile is not None:
+            request.profile.extend(stages)
+        return result
+
+    def _profiled(self, profile, function, args):
+        if profile:
+            self.metrics.start_profile()
+        try:
+            result = function(*args)
+        finally:
+            stages = self.metrics.stop_profile() if profile else []
+        return result, stages
+
+    async def recommend(self, request):
+        if request.content_type != 'application/json':
+            return self.json({'error': 'Content-Type must be application/json'}, 415)
+        data = request.get_json()
+        if data is None:
+            return self.json({'error': 'Failed to decode JSON object'}, 400)
+
+        payload, status = await self.run_in_worker(request, self.api.recommend_payload, data)
+        return self.timed_json(request, payload, status)
+
+    async def recommend_batch(self, request):
+        if request.content_type != 'application/json':
+            return self.json({'error': 'Content-Type must be application/json'}, 415)
+        data = request.get_json()
+        if data is None:
+            return self.json({'error': 'Failed to decode JSON object'}, 400)
+
+        payload, status = await self.run_in_worker(request, self.api.recommend_batch_payload, data)
+        return self.timed_json(request, payload, status)
+
+    async def recommend_group(self, request):
+        if request.content_type != 'application/json':
+            return self.json({'error': 'Content-Type must be application/json'}, 415)
+        data = request.get_json()
+        if data is None:
+            return self.json({'error': 'Failed to decode JSON object'}, 400)
+
+        try:
+            try:
+                query = self.api.parse_group_recommend_query(data)
+            except ValueError as e:
+                return self.json({'error': str(e)}, 400)
+
+            find_leader = self.api.find_leader
+            with self.stage(request, 'leader.fetch'):
+                if self.async_db_pool is None:
+                    group = await self.run_in_worker(request, find_leader.get_user_preference, query['chatroom_id'])
+                else:
+                    group = await find_leader.get_user_preference_async(query['chatroom_id'], self.async_db_pool)
+
+            payload, status = await self.run_in_worker(request, self.api.group_recommend_payload, query, group)
+            return self.timed_json(request, payload, status)
+
+        except Exception as e:
+            return self.json({"error": str(e)}, 500)
+
+    async def recommend_cache_stats(self, request):
+        return self.json(self.api.recommendation_system.response_cache_stats())
+
+    async def find_leader(self, request):
+        try:
+            try:
+                chatroom_id = self.api.parse_leader_query(request.get_json())
+            except ValueError as e:
+                return self.json({"error": str(e)}, 400)
+
+            find_leader = self.api.find_leader
+            if self.async_db_pool is None:
+                result = await self.run_in_worker(request, find_leader.main, chatroom_id)
+            else:
+                with self.stage(request, 'leader.fetch'):
+                    group = await find_leader.get_user_preference_async(chatroom_id, self.async_db_pool)
+                result = await self.run_in_worker(request, find_leader.cached_analyze_group, chatroom_id, group)
+
+            return self.timed_json(request, self.api.format_leader(result))
+
+        except Exception as e:
+            return self.json({"error": str(e)}, 500)
+
+    async def find_leader_batch(self, request):
+        try:
+            try:
+                chatroom_ids = self.api.parse_leader_batch_query(request.get_json())
+            except ValueError as e:
+                return self.json({"error": str(e)}, 400)
+
+            find_leader = self.api.find_leader
+            if self.async_db_pool is None:
+                batch = await self.run_in_worker(request, find_leader.main_batch, chatroom_ids)
+            else:
+                with self.stage(request, 'leader.fetch_batch'):
+                    groups = await find_leader.get_user_preferences_async(chatroom_ids, self.async_db_pool)
+                batch = await self.run_in_worker(request, find_leader.analyze_groups, groups)
+
+            return self.timed_json(request, self.api.format_leader_batch(batch))
+
+        except Exception as e:
+            return self.json({"error": str(e)}, 500)
+
+    async def invalidate_leader_preferences(self, request):
+        return self.json(*self.api.invalidate_leader_payload(request.get_json()))
+
+    async def leader_cache_stats(self, request):
+        return self.json(self.api.find_leader.result_cache.stats())
+
+    async def reload_catalog(self, request):
+        # 重新載入會掃描整張表並重建索引，不能在 event loop 上執行
+        return self.json(*await self.run_in_worker(request, self.api.reload_catalog_payload))
+
+    async def render_metrics(self, request):
+        return self.metrics.render().encode('utf-8'), 200, 'text/plain; version=0.0.4; charset=utf-8'
+
+    async def db_pool_stats(self, request):
+        return self.json(self.api.recommendation_system.db_pool.stats())
+
+    def run(self, host='0.0.0.0', port=5001):
+        try:
+            import uvicorn
+        except ImportError:
+            raise ImportError("The async serving mode needs an ASGI server: pip install uvicorn")
+        uvicorn.run(self, host=host, port=port)
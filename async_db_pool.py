@@ -0,0 +1,133 @@
+import asyncio
+import contextlib
+import threading
+import time
+
+from db_pool import PoolTimeout
+
+try:
+    import asyncpg
+except ImportError:  # asyncpg 只有 async serving mode 需要
+    asyncpg = None
+
+
+class AsyncDatabasePool:
+    """
+    asyncpg connection pool used by the async serving mode.
+
+    Takes the same db_config as DatabasePool (empty values are left to
+    asyncpg's defaults). Queries use asyncpg's `$1` placeholders; broken
+    connections are reset and replaced by asyncpg itself.
+    """
+
+    def __init__(self, db_config, minconn=1, maxconn=10, checkout_timeout=30):
+        if asyncpg is None:
+            raise ImportError("AsyncDatabasePool requires asyncpg: pip install asyncpg")
+
+        self.db_config = {key: value for key, value in db_config.items() if value not in ('', None)}
+        if 'port' in self.db_config:
+            self.db_config['port'] = int(self.db_config['port'])
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+
+        self._pool = None
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._parameter_types = {}
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'max_in_use': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    async def open(self):
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(min_size=self.minconn, max_size=self.maxconn, **self.db_config)
+        return self
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        """
+        Check out a pooled connection for the duration of the `async with` block.
+
+        Raises:
+            PoolTimeout: no connection became free within `checkout_timeout` seconds.
+        """
+        await self.open()
+
+        started = time.monotonic()
+        try:
+            conn = await self._pool.acquire(timeout=self.checkout_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PoolTimeout(f"no database connection available within {self.checkout_timeout}s")
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            self._stats['max_in_use'] = max(self._stats['max_in_use'], self._in_use)
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            await self._pool.release(conn)
+
+    async def fetch(self, sql, *args, columns=None):
+        """
+        Run a query on a pooled connection.
+
+        Parameters:
+            columns (list): the query's column names when known up front; the query then goes
+                through asyncpg's statement cache instead of an explicit prepare per call.
+
+        Returns:
+            column_name (list), records (list of tuples)
+
+        Raises:
+            PoolTimeout: no connection became free within `checkout_timeout` seconds.
+        """
+        async with self.connection() as conn:
+            if columns is not None:
+                return list(columns), [tuple(record) for record in await conn.fetch(sql, *args)]
+
+            # prepare 才拿得到欄位名稱，查無資料時也能建立正確欄位的 DataFrame
+            statement = await conn.prepare(sql)
+            column_name = [attribute.name for attribute in statement.get_attributes()]
+            records = [tuple(record) for record in await statement.fetch(*args)]
+
+        return column_name, records
+
+    async def parameter_types(self, sql):
+        """
+        Postgres type names of `sql`'s parameters (e.g. 'int4', '_text' for text[]), prepared once per query.
+        """
+        types = self._parameter_types.get(sql)
+        if types is None:
+            async with self.connection() as conn:
+                statement = await conn.prepare(sql)
+            types = [parameter.name for parameter in statement.get_parameters()]
+            self._parameter_types[sql] = types
+        return types
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_use'] = self._in_use
+        stats['max_size'] = self.maxconn
+        stats['utilization'] = stats['in_use'] / self.maxconn if self.maxconn else 0.0
+        stats['wait_seconds_avg'] = stats['wait_seconds_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
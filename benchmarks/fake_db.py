@@ -0,0 +1,87 @@
+"""
+In-process stand-in for DatabasePool that serves generated rows instead of Postgres.
+
+Only the queries issued by RecommendationSystem1.get_restaurants and
+FindLeader.get_user_preference(s) are understood.
+"""
+from contextlib import contextmanager
+
+from find_leader import column_mapping
+
+PREFERENCE_COLUMNS = ["user_id"] + list(column_mapping)
+
+
+class InMemoryCursor:
+    def __init__(self, database):
+        self.database = database
+        self.description = None
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        params = list(params or ())
+        if "FROM restaurant" in sql:
+            rows = self.database.restaurants
+            if "id > %s" in sql:
+                since_id = params[0]
+                rows = [row for row in rows if row[0] > since_id]
+            self.description = [(name,) for name in
+                                ("id", "name", "address", "category", "price", "opening_time", "rating", "phone")]
+            self._rows = list(rows)
+        elif "chatroom_participant" in sql:
+            if "IN %s" in sql:
+                chatroom_ids = set(params[0])
+                columns = ["chatroom_id"] + PREFERENCE_COLUMNS
+                rows = [row for chatroom_id in chatroom_ids
+                        for row in self.database.chatrooms.get(chatroom_id, [])]
+            else:
+                columns = PREFERENCE_COLUMNS
+                rows = [row[1:] for row in self.database.chatrooms.get(params[0], [])]
+            self.description = [(name,) for name in columns]
+            self._rows = rows
+        elif sql.strip() == "SELECT 1":
+            self._rows = [(1,)]
+        else:
+            raise NotImplementedError(sql)
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class InMemoryConnection:
+    closed = 0
+
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self):
+        return InMemoryCursor(self.database)
+
+    def rollback(self):
+        pass
+
+
+class InMemoryDatabasePool:
+    """
+    Parameters:
+        restaurants (list): restaurant rows, see generators.generate_restaurants.
+        chatrooms (dict): chatroom_id -> rows from generators.generate_chatroom.
+    """
+
+    def __init__(self, restaurants=(), chatrooms=None):
+        self.restaurants = list(restaurants)
+        self.chatrooms = dict(chatrooms or {})
+        self.checkouts = 0
+
+    @contextmanager
+    def connection(self):
+        self.checkouts += 1
+        yield InMemoryConnection(self)
+
+    def stats(self):
+        return {'checkouts': self.checkouts, 'in_use': 0, 'max_size': 1, 'utilization': 0.0}
+
+    def close(self):
+        pass
@@ -0,0 +1,117 @@
+"""
+Seeded generators for synthetic restaurant catalogs and chatroom preference tables.
+"""
+import random
+from decimal import Decimal
+
+from find_leader import column_mapping
+from opening_hours import WEEKDAYS
+
+REGIONS = [
+    ("台北市", ["大安區", "信義區", "中山區", "松山區", "士林區", "萬華區", "內湖區"]),
+    ("新北市", ["板橋區", "新莊區", "中和區", "永和區", "三重區", "淡水區"]),
+    ("台中市", ["西屯區", "北屯區", "南屯區", "西區"]),
+    ("台南市", ["東區", "中西區", "安平區"]),
+    ("高雄市", ["苓雅區", "左營區", "前鎮區", "鼓山區"]),
+    ("新竹縣", ["竹北市", "湖口鄉", "竹東鎮"]),
+]
+ROADS = ["忠孝東路", "復興南路", "中山北路", "民生東路", "文化路", "台灣大道", "中正路", "光復路", "和平東路", "仁愛路"]
+NAME_PREFIXES = ["老王", "阿明", "小林", "福記", "鼎泰", "金春", "大和", "山田", "首爾", "曼谷", "米蘭", "巴黎", "德州", "好味"]
+DISHES = {
+    "中式": ["牛肉麵", "炒飯", "餃子", "火鍋", "小籠包", "滷肉飯"],
+    "日式": ["壽司", "拉麵", "丼飯", "燒肉", "天婦羅", "居酒屋"],
+    "美式": ["漢堡", "炸雞", "牛排", "早午餐"],
+    "義式": ["披薩", "義大利麵", "燉飯"],
+    "法式": ["可頌", "甜點", "小酒館"],
+    "韓式": ["烤肉", "炸雞", "豆腐鍋", "拌飯"],
+    "泰式": ["打拋豬", "綠咖哩", "月亮蝦餅"],
+    "越式": ["河粉", "法國麵包"],
+    "港式": ["燒臘", "茶餐廳", "點心"],
+    "甜點": ["鬆餅", "冰店", "蛋糕"],
+    "酒吧": ["調酒", "精釀啤酒"],
+}
+NAME_SUFFIXES = ["", "店", "館", "食堂", "餐廳", "料理", "屋"]
+CATEGORIES = list(DISHES)
+
+
+def _clock(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _day_hours(rng, day):
+    roll = rng.random()
+    if roll < 0.10:
+        return f"星期{day} 休息"
+    if roll < 0.15:
+        return f"星期{day} 24 小時營業"
+    if roll < 0.22:
+        start = rng.choice([18, 19, 20, 21]) * 60
+        return f"星期{day} {_clock(start)}–{_clock(rng.choice([1, 2, 3]) * 60)}"
+    if roll < 0.60:
+        lunch = rng.choice([10, 11]) * 60 + rng.choice([0, 30])
+        dinner = rng.choice([17, 17, 18]) * 60
+        return f"星期{day} {_clock(lunch)}–{_clock(lunch + 210)} {_clock(dinner)}–{_clock(dinner + 240)}"
+    start = rng.choice([7, 8, 9, 10, 11]) * 60
+    return f"星期{day} {_clock(start)}–{_clock(start + rng.choice([8, 10, 11, 12]) * 60)}"
+
+
+def _price(rng):
+    roll = rng.random()
+    if roll < 0.05:
+        return None
+    if roll < 0.08:
+        return rng.choice(["$$", "價格不定", "200-"])
+    lower = rng.choice([50, 100, 150, 200, 300, 400, 500, 800, 1000, 1500])
+    upper = lower + rng.choice([100, 200, 300, 500, 1000])
+    if upper >= 1000:
+        return f"{lower:,}-{upper:,}"
+    return f"{lower}-{upper}"
+
+
+def generate_restaurants(count, seed=0):
+    """
+    Rows shaped like `SELECT id, name, address, category, price, opening_time, rating, phone FROM restaurant`.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for restaurant_id in range(1, count + 1):
+        category = rng.choice(CATEGORIES)
+        name = rng.choice(NAME_PREFIXES) + rng.choice(DISHES[category]) + rng.choice(NAME_SUFFIXES)
+        city, districts = rng.choice(REGIONS)
+        address = f"{city}{rng.choice(districts)}{rng.choice(ROADS)}{rng.randint(1, 9)}段{rng.randint(1, 400)}號"
+        opening_time = ", ".join(_day_hours(rng, day) for day in WEEKDAYS)
+        rating = Decimal(f"{rng.uniform(2.5, 5.0):.1f}")
+        phone = f"0{rng.randint(2, 8)}-{rng.randint(2000, 8999)}-{rng.randint(1000, 9999)}"
+        rows.append((restaurant_id, name, address, category, _price(rng), opening_time, rating, phone))
+    return rows
+
+
+def generate_chatroom(members, seed=0, chatroom_id="chatroom-0"):
+    """
+    Rows shaped like the chatroom_participant JOIN user_preference query:
+    (chatroom_id, user_id, <one 0-5 rating per column_mapping key>).
+    """
+    rng = random.Random(seed)
+    rows = []
+    for member in range(members):
+        taste = [rng.choice([0, 0, 1, 2, 3, 4, 5]) for _ in column_mapping]
+        if not any(taste):
+            taste[rng.randrange(len(taste))] = rng.randint(1, 5)
+        rows.append((chatroom_id, f"{chatroom_id}-user-{member}", *taste))
+    return rows
+
+
+def generate_query(rng):
+    """
+    A /recommend query in recommend_restaurants' argument form.
+    """
+    city, districts = rng.choice(REGIONS)
+    category = rng.choice(CATEGORIES)
+    return {
+        'location': rng.choice([None, city, rng.choice(districts)]),
+        'cuisine_type': rng.choice([None, category]),
+        'price_range': rng.choice([-1, -1, 150, 300, 600]),
+        'dining_day': rng.choice([None, rng.choice(WEEKDAYS)]),
+        'dining_hour': rng.choice(["12:00", "12:30", "18:30", "19:00", "23:30"]),
+        'user_preferences': rng.sample(DISHES[category], k=min(2, len(DISHES[category]))),
+    }
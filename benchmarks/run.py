@@ -0,0 +1,236 @@
+"""
+Benchmarks for RecommendationSystem1 and FindLeader on seeded synthetic data.
+
+Runs every pipeline stage against an in-process stand-in for the database
+and reports latency percentiles, throughput and peak traced memory:
+
+    python -m benchmarks.run --catalog-sizes 1000 10000 100000 --group-sizes 2 10 100 500
+    python -m benchmarks.run --output benchmarks/results/new.json --compare benchmarks/results/old.json
+
+Catalog sizes up to 1000000 are supported but building the TF-IDF index
+tokenizes every restaurant name, so the largest sizes take minutes to load.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import jieba
+import numpy as np
+import pandas as pd
+
+from benchmarks.fake_db import InMemoryDatabasePool
+from benchmarks.generators import generate_chatroom, generate_query, generate_restaurants
+from find_leader import FindLeader
+from metrics import MetricsRegistry
+from recommendation_system1 import RecommendationSystem1
+
+DEFAULT_JIEBA_DICT = os.path.join(os.path.dirname(jieba.__file__), 'dict.txt')
+
+
+def measure(function, repeat, warmup=1, items=1):
+    """
+    Time `function` `repeat` times, then run it once more under tracemalloc.
+
+    Returns:
+        result (dict): latency percentiles in milliseconds, throughput (items per second)
+            and peak traced memory in MiB.
+    """
+    for _ in range(warmup):
+        function()
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    milliseconds = np.array(samples) * 1000
+    return {
+        'repeat': repeat,
+        'p50_ms': float(np.percentile(milliseconds, 50)),
+        'p95_ms': float(np.percentile(milliseconds, 95)),
+        'p99_ms': float(np.percentile(milliseconds, 99)),
+        'mean_ms': float(milliseconds.mean()),
+        'throughput_per_s': items * repeat / sum(samples) if sum(samples) else float('inf'),
+        'peak_memory_mib': peak / 2**20,
+    }
+
+
+def cycle(values):
+    position = 0
+    def next_value():
+        nonlocal position
+        value = values[position % len(values)]
+        position += 1
+        return value
+    return next_value
+
+
+def benchmark_recommendation(catalog_size, repeat, seed, jieba_dict_path):
+    results = {}
+    prefix = f"recommend/catalog={catalog_size}"
+
+    restaurants = generate_restaurants(catalog_size, seed=seed)
+    db_pool = InMemoryDatabasePool(restaurants)
+
+    started = time.perf_counter()
+    system = RecommendationSystem1({}, jieba_dict_path, catalog_refresh_interval=0, db_pool=db_pool,
+                                   response_cache_size=0, metrics=MetricsRegistry())
+    results[f"{prefix}/startup"] = {'seconds': time.perf_counter() - started, **system.startup_timings}
+
+    snapshot = system.catalog.snapshot
+    for name, build in system.catalog.index_builders.items():
+        results[f"{prefix}/index.{name}"] = measure(lambda: build(snapshot), repeat=1, warmup=0)
+
+    rng = random.Random(seed)
+    queries = [generate_query(rng) for _ in range(max(repeat, 20))]
+
+    next_query = cycle(queries)
+    def filter_stage():
+        query = next_query()
+        system.filter_restaurants(snapshot, query['location'], query['price_range'],
+                                  query['dining_day'], query['dining_hour'])
+    results[f"{prefix}/filter"] = measure(filter_stage, repeat)
+
+    candidates = [(query, system.filter_restaurants(snapshot, query['location'], query['price_range'],
+                                                    query['dining_day'], query['dining_hour']))
+                  for query in queries]
+    candidates = [(query, positions) for query, positions in candidates if len(positions)]
+    if candidates:
+        next_candidates = cycle(candidates)
+        def score_stage():
+            query, positions = next_candidates()
+            system.enhance_with_user_preferences(snapshot, positions, query['user_preferences'],
+                                                 query['cuisine_type'], limit=20)
+        results[f"{prefix}/score_and_rank"] = measure(score_stage, repeat)
+
+    next_query = cycle(queries)
+    def recommend():
+        query = next_query()
+        system.recommend_restaurants(query['location'], query['cuisine_type'], query['price_range'],
+                                     query['dining_day'], query['dining_hour'], query['user_preferences'], limit=20)
+    results[f"{prefix}/recommend"] = measure(recommend, repeat)
+
+    batch = queries[:20]
+    results[f"{prefix}/recommend_batch20"] = measure(
+        lambda: system.recommend_restaurants_batch(batch, limit=20), max(1, repeat // 5), items=len(batch))
+
+    system.catalog.stop()
+    return results
+
+
+def benchmark_find_leader(group_size, repeat, seed):
+    results = {}
+    prefix = f"find_leader/members={group_size}"
+
+    chatroom_id = f"chatroom-{group_size}"
+    rows = generate_chatroom(group_size, seed=seed, chatroom_id=chatroom_id)
+    db_pool = InMemoryDatabasePool(chatrooms={chatroom_id: rows})
+
+    cold = FindLeader({}, db_pool=db_pool, cache_size=0, state_cache_size=0, metrics=MetricsRegistry())
+    group = cold.get_user_preference(chatroom_id).set_index('user_id')
+
+    results[f"{prefix}/fetch"] = measure(lambda: cold.get_user_preference(chatroom_id), repeat)
+    results[f"{prefix}/calculate_trust"] = measure(lambda: cold.calculate_trust(group), repeat)
+    results[f"{prefix}/calculate_similarity"] = measure(lambda: cold.calculate_similarity(group), repeat)
+    results[f"{prefix}/influenced_rating"] = measure(lambda: cold.influenced_rating(group), repeat)
+    results[f"{prefix}/main_cold"] = measure(lambda: cold.main(chatroom_id), repeat)
+
+    # 每次呼叫前改動一位成員的偏好，量測增量更新的路徑
+    incremental = FindLeader({}, db_pool=db_pool, cache_size=0, metrics=MetricsRegistry())
+    incremental.main(chatroom_id)
+    rng = random.Random(seed)
+    def main_after_update():
+        member = rng.randrange(group_size)
+        row = list(db_pool.chatrooms[chatroom_id][member])
+        row[2 + rng.randrange(len(row) - 2)] = rng.randint(1, 5)
+        db_pool.chatrooms[chatroom_id][member] = tuple(row)
+        incremental.main(chatroom_id)
+    results[f"{prefix}/main_incremental"] = measure(main_after_update, repeat)
+
+    cached = FindLeader({}, db_pool=db_pool, metrics=MetricsRegistry())
+    results[f"{prefix}/main_cached"] = measure(lambda: cached.main(chatroom_id), repeat)
+
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    print(f"{'benchmark':<58} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>10} {'peak MiB':>9}"
+          + (f" {'p50 vs base':>12}" if baseline else ""))
+    for name, result in results.items():
+        if 'p50_ms' not in result:
+            print(f"{name:<58} {result['seconds'] * 1000:>10.1f}")
+            continue
+        line = (f"{name:<58} {result['p50_ms']:>10.3f} {result['p95_ms']:>10.3f} {result['p99_ms']:>10.3f}"
+                f" {result['throughput_per_s']:>10.1f} {result['peak_memory_mib']:>9.2f}")
+        previous = (baseline or {}).get(name)
+        if previous and previous.get('p50_ms'):
+            line += f" {result['p50_ms'] / previous['p50_ms']:>11.2f}x"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--catalog-sizes', type=int, nargs='*', default=[1000, 10000, 100000])
+    parser.add_argument('--group-sizes', type=int, nargs='*', default=[2, 10, 50, 100, 500])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jieba-dict', default=DEFAULT_JIEBA_DICT)
+    parser.add_argument('--output', help="JSON results path (default: benchmarks/results/<git revision>.json)")
+    parser.add_argument('--compare', help="JSON results of a previous run to compare p50 latencies against")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for catalog_size in args.catalog_sizes:
+        results.update(benchmark_recommendation(catalog_size, args.repeat, args.seed, args.jieba_dict))
+    for group_size in args.group_sizes:
+        results.update(benchmark_find_leader(group_size, args.repeat, args.seed))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(os.path.dirname(__file__), 'results', f"{git_revision() or 'unversioned'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from restaurant_catalog import RESTAURANT_COLUMNS, RestaurantCatalog
+
+FORMAT_VERSION = 1
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+TEXT_COLUMNS = ("name", "address", "category", "price", "opening_time", "phone")
+
+
+def _encode_text_column(values):
+    encoded = [(value or '').encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return {
+        'data': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'offsets': offsets,
+        'null': np.fromiter((value is None for value in values), dtype=bool, count=len(values)),
+    }
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class MappedTextColumn:
+    """
+    Read-only sequence of strings (or None) decoded on access from memory-mapped UTF-8 bytes.
+    """
+
+    def __init__(self, data, offsets, null):
+        self.data = data
+        self.offsets = offsets
+        self.null = null
+
+    def __len__(self):
+        return len(self.null)
+
+    def __getitem__(self, position):
+        if self.null[position]:
+            return None
+        return self.data[self.offsets[position]:self.offsets[position + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        return (self[position] for position in range(len(self)))
+
+
+class MappedRows:
+    """
+    Sequence of row tuples over a MappedCatalogSnapshot, built one row at a time.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def __getitem__(self, position):
+        return self.snapshot.row(position)
+
+    def __iter__(self):
+        return (self.snapshot.row(position) for position in range(len(self)))
+
+
+class MappedCatalogSnapshot:
+    """
+    A catalog snapshot read from a CatalogStore export.
+
+    Offers the same interface as CatalogSnapshot (`len`, `column`, `take`,
+    `get_index`, `rows`), but every column and index array is a read-only
+    memory map, so worker processes loading the same export share its pages.
+    Row tuples are decoded only for the restaurants actually returned;
+    `rating` comes back as a float instead of a Decimal.
+    """
+
+    def __init__(self, path, manifest, columns, version, indexes=None):
+        self.path = path
+        self.manifest = manifest
+        self.columns = columns
+        self.version = version
+        self.watermark = tuple(manifest['watermark']) if manifest.get('watermark') else None
+        self.indexes = indexes if indexes is not None else {}
+        self.loaded_at = time.time()
+        self.rows = MappedRows(self)
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    def value(self, name, position):
+        value = self.columns[name][position]
+        if name == 'id':
+            return int(value)
+        if name == 'rating':
+            return None if np.isnan(value) else float(value)
+        return value
+
+    def row(self, position):
+        return tuple(self.value(name, position) for name in RESTAURANT_COLUMNS)
+
+    def column(self, name):
+        if name == 'id':
+            return self.columns['id'].tolist()
+        if name == 'rating':
+            return [None if np.isnan(value) else value for value in self.columns['rating'].tolist()]
+        return list(self.columns[name])
+
+    def take(self, positions):
+        return [self.row(position) for position in positions]
+
+    def get_index(self, name):
+        return self.indexes.get(name)
+
+
+class CatalogStore:
+    """
+    Versioned on-disk columnar copy of catalog snapshots and their indexes.
+
+    Every export goes to its own directory under `root` (one .npy file per
+    column or index array plus a manifest.json) and is published by atomically
+    replacing `root/CURRENT`, so readers never see a half-written version.
+    `load` maps every array read-only, letting the page cache back all the
+    worker processes with a single copy of the data.
+    """
+
+    def __init__(self, root, keep=3):
+        """
+        Parameters:
+            root (str): Directory holding the exported versions.
+            keep (int): Number of most recent exports kept on disk.
+        """
+        self.root = root
+        self.keep = keep
+        os.makedirs(root, exist_ok=True)
+
+    def current(self):
+        """
+        Name of the published export, or None when nothing was exported yet.
+        """
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def export(self, snapshot):
+        """
+        Write `snapshot` and every index exposing `to_arrays()`, then publish it as the current version.
+
+        Returns:
+            name (str): the export's directory name.
+        """
+        name = f"{datetime.datetime.now():%Y%m%dT%H%M%S%f}-v{snapshot.version}"
+        staging = tempfile.mkdtemp(prefix=".export-", dir=self.root)
+        try:
+            files = {}
+
+            def save(key, array):
+                filename = f"{key}.npy"
+                np.save(os.path.join(staging, filename), np.ascontiguousarray(array), allow_pickle=False)
+                files[key] = filename
+
+            save('column.id', np.asarray(snapshot.column('id'), dtype=np.int64))
+            ratings = [np.nan if rating is None else float(rating) for rating in snapshot.column('rating')]
+            save('column.rating', np.asarray(ratings, dtype=np.float64))
+            for column in TEXT_COLUMNS:
+                for part, array in _encode_text_column(snapshot.column(column)).items():
+                    save(f"column.{column}.{part}", array)
+
+            indexes = {}
+            for index_name, index in snapshot.indexes.items():
+                if not hasattr(index, 'to_arrays'):
+                    continue
+                arrays, meta = index.to_arrays()
+                for key, array in arrays.items():
+                    save(f"index.{index_name}.{key}", array)
+                indexes[index_name] = {'arrays': sorted(arrays), 'meta': meta}
+
+            manifest = {
+                'format_version': FORMAT_VERSION,
+                'source_version': snapshot.version,
+                'rows': len(snapshot),
+                'watermark': list(snapshot.watermark) if snapshot.watermark else None,
+                'exported_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'files': files,
+                'indexes': indexes,
+            }
+            with open(os.path.join(staging, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, default=_json_default)
+
+            os.rename(staging, os.path.join(self.root, name))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        # CURRENT 以 os.replace 原子替換，讀取端只會看到完整的版本
+        pointer = os.path.join(self.root, f".{CURRENT_FILE}.{os.getpid()}")
+        with open(pointer, 'w', encoding='utf-8') as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(self.root, CURRENT_FILE))
+
+        self.prune()
+        return name
+
+    def versions(self):
+        return sorted(entry for entry in os.listdir(self.root)
+                      if not entry.startswith('.') and os.path.isfile(os.path.join(self.root, entry, MANIFEST_FILE)))
+
+    def prune(self):
+        # 已映射舊版本的行程在 POSIX 上仍可讀取被刪除的檔案
+        current = self.current()
+        for name in self.versions()[:-self.keep or None]:
+            if name != current:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def load(self, name=None, version=0, index_loaders=None, index_builders=None):
+        """
+        Memory-map an export.
+
+        Parameters:
+            name (str): Export to load, the current one when None.
+            version (int): Version number given to the returned snapshot.
+            index_loaders (dict): index name -> callable(snapshot, arrays, meta) rebuilding it from the export.
+            index_builders (dict): index name -> callable(snapshot), used for indexes missing from the export.
+
+        Returns:
+            snapshot (MappedCatalogSnapshot)
+        """
+        name = name or self.current()
+        if name is None:
+            raise FileNotFoundError(f"no catalog exported under {self.root}")
+        path = os.path.join(self.root, name)
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"unsupported catalog format {manifest['format_version']} in {path}")
+
+        def mapped(key):
+            return np.load(os.path.join(path, manifest['files'][key]), mmap_mode='r', allow_pickle=False)
+
+        columns = {'id': mapped('column.id'), 'rating': mapped('column.rating')}
+        for column in TEXT_COLUMNS:
+            columns[column] = MappedTextColumn(*(mapped(f"column.{column}.{part}") for part in ('data', 'offsets', 'null')))
+
+        snapshot = MappedCatalogSnapshot(path, manifest, columns, version)
+        for index_name, loader in (index_loaders or {}).items():
+            stored = manifest['indexes'].get(index_name)
+            if stored is not None:
+                arrays = {key: mapped(f"index.{index_name}.{key}") for key in stored['arrays']}
+                snapshot.indexes[index_name] = loader(snapshot, arrays, stored['meta'])
+        for index_name, build in (index_builders or {}).items():
+            if index_name not in snapshot.indexes:
+                snapshot.indexes[index_name] = build(snapshot)
+        return snapshot
+
+
+class MappedRestaurantCatalog(RestaurantCatalog):
+    """
+    RestaurantCatalog for worker processes that never query the database.
+
+    Serves the exports another process publishes to a CatalogStore (see
+    RestaurantCatalog's `store`), picking up a newly published version on
+    every refresh.
+    """
+
+    def __init__(self, store, index_loaders, index_builders=None, refresh_interval=60, metrics=None):
+        super().__init__(None, refresh_interval=refresh_interval, index_builders=index_builders, metrics=metrics,
+                         full_reload_every=None)
+        self.store = store
+        self.index_loaders = dict(index_loaders)
+        self.loaded_name = None
+
+    def reload(self):
+        with self._lock:
+            name = self.store.current()
+            if name is None:
+                print(f"Restaurant catalog: nothing exported under {self.store.root} yet")
+                if not self.snapshot.indexes:
+                    # 匯出前先提供有索引的空 catalog，請求回傳空結果而不是錯誤
+                    self.snapshot = self._build((), None)
+                return self.snapshot
+            self._load(name)
+            return self.snapshot
+
+    def refresh(self):
+        with self._lock:
+            name = self.store.current()
+            if name is None or name == self.loaded_name:
+                return 0
+            self._load(name)
+            return len(self.snapshot)
+
+    def _load(self, name):
+        with self._timer('catalog.load_mapped'):
+            snapshot = self.store.load(name, version=self._version + 1,
+                                       index_loaders=self.index_loaders, index_builders=self.index_builders)
+        self._version += 1
+        self.loaded_name = name
+        self.snapshot = snapshot
@@ -0,0 +1,278 @@
+import threading
+
+import numpy as np
+from scipy.spatial import distance
+
+
+def rank_members(scores, members):
+    """
+    Order members by score, highest first, independently of their positions.
+
+    NaN scores rank first (as argsort(...)[::-1] left them), and ties,
+    including scores equal up to rounding error, go by ascending member id,
+    so the incremental and from-scratch paths agree whatever order the
+    members arrived in.
+
+    Parameters:
+        scores (ndarray): ts_sumation of each member.
+        members (list): member ids, in the order of `scores`.
+
+    Returns:
+        sorted_positions (ndarray): positions into `members`; the first one is the leader.
+    """
+    scores = np.asarray(scores, dtype=float)
+    is_nan = np.isnan(scores)
+    # 只差捨入誤差的分數視為同分
+    rounded = np.where(is_nan, 0.0, np.round(scores, 9))
+    id_rank = np.empty(len(members), dtype=np.int64)
+    id_rank[sorted(range(len(members)), key=lambda position: members[position])] = np.arange(len(members))
+    return np.lexsort((id_rank, -rounded, ~is_nan))
+
+
+class ChatroomMatrixState:
+    """
+    Trust and similarity matrices of one chatroom, maintained incrementally.
+
+    Matrices live in preallocated arrays that grow by doubling. Adding,
+    removing or updating a member recomputes only that member's row and
+    column, and the column sums used to pick the leader are patched in
+    place, so each change costs O(N * items) instead of O(N^2 * items).
+    NaN entries (e.g. the PCC of a member who gave every item the same
+    rating) are tracked by count so they do not poison the running sums.
+    """
+
+    def __init__(self, items, capacity=8):
+        self.items = list(items)
+        self.lock = threading.RLock()
+        self.members = []
+        self.positions = {}
+        self.updates_since_resync = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        num_items = len(self.items)
+        self.capacity = capacity
+        self.ratings = np.zeros((capacity, num_items))
+        self.rated = np.zeros((capacity, num_items))
+        self.normalized = np.zeros((capacity, num_items))
+        self.trust = np.zeros((capacity, capacity))
+        self.similarity = np.zeros((capacity, capacity))
+        self.trust_sum = np.zeros(capacity)
+        self.similarity_sum = np.zeros(capacity)
+        self.trust_nan = np.zeros(capacity, dtype=np.int64)
+        self.similarity_nan = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self):
+        n = len(self.members)
+        old = (self.ratings, self.rated, self.normalized, self.trust, self.similarity)
+        self._allocate(self.capacity * 2)
+        self.ratings[:n], self.rated[:n], self.normalized[:n] = old[0][:n], old[1][:n], old[2][:n]
+        self.trust[:n, :n], self.similarity[:n, :n] = old[3][:n, :n], old[4][:n, :n]
+        self.resync()
+
+    @classmethod
+    def from_group(cls, group):
+        """
+        Build the state of a group from scratch.
+
+        Parameters:
+            group (DataFrame): members' ratings indexed by user id.
+        """
+        state = cls(group.columns, capacity=max(8, len(group)))
+        ratings = group.to_numpy(dtype=float)
+        n = len(ratings)
+        state.members = list(group.index)
+        state.positions = {member: position for position, member in enumerate(state.members)}
+        state.ratings[:n] = ratings
+        state.rated[:n] = ratings > 0
+        state.normalized[:n] = state._normalize(ratings)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            state.trust[:n, :n] = state._trust_rows(np.arange(n))[0]
+        np.fill_diagonal(state.trust[:n, :n], 0.0)
+        state.similarity[:n, :n] = np.clip(state.normalized[:n] @ state.normalized[:n].T, -1, 1)
+        state.resync()
+        return state
+
+    def __len__(self):
+        return len(self.members)
+
+    def _normalize(self, ratings):
+        # 與 np.corrcoef 相同：減去平均後除以長度，常數列得到 nan
+        centered = ratings - ratings.mean(axis=-1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return centered / np.linalg.norm(centered, axis=-1, keepdims=True)
+
+    def _trust_rows(self, positions):
+        """
+        trust[u, v] for u in `positions` and every current member v, plus the
+        transposed trust[v, u] (same formula as FindLeader.calculate_trust).
+        """
+        n = len(self.members)
+        rated = self.rated[:n]
+        count_rated = rated.sum(axis=1)
+        count_intersection = rated[positions] @ rated.T
+
+        dst = 1 / (1 + distance.cdist(self.ratings[positions], self.ratings[:n], 'euclidean'))
+
+        partnership = count_intersection / count_rated[positions][:, np.newaxis]
+        rows = (2 * partnership * dst) / (partnership + dst)
+
+        partnership = count_intersection / count_rated[np.newaxis, :]
+        columns = (2 * partnership * dst) / (partnership + dst)
+
+        return rows, columns
+
+    def resync(self):
+        """
+        Recompute the column sums from the matrices, dropping accumulated rounding error.
+        """
+        n = len(self.members)
+        self.trust_sum[:] = 0.0
+        self.similarity_sum[:] = 0.0
+        self.trust_nan[:] = 0
+        self.similarity_nan[:] = 0
+        self.trust_sum[:n] = np.nansum(self.trust[:n, :n], axis=0)
+        self.similarity_sum[:n] = np.nansum(self.similarity[:n, :n], axis=0)
+        self.trust_nan[:n] = np.isnan(self.trust[:n, :n]).sum(axis=0)
+        self.similarity_nan[:n] = np.isnan(self.similarity[:n, :n]).sum(axis=0)
+        self.updates_since_resync = 0
+
+    def _patch_sums(self, matrix, sums, nan_counts, position, new_row, new_column):
+        """
+        Replace row and column `position` of `matrix`, updating column sums and NaN counts in O(N).
+        """
+        n = len(self.members)
+        old_row = matrix[position, :n].copy()
+        others = np.arange(n) != position
+
+        # 其他欄只有第 position 列改變
+        sums[:n][others] += np.where(np.isnan(new_row[others]), 0.0, new_row[others])
+        sums[:n][others] -= np.where(np.isnan(old_row[others]), 0.0, old_row[others])
+        nan_counts[:n][others] += np.isnan(new_row[others]).astype(np.int64) - np.isnan(old_row[others])
+
+        matrix[position, :n] = new_row
+        matrix[:n, position] = new_column
+
+        column = matrix[:n, position]
+        sums[position] = np.nansum(column)
+        nan_counts[position] = np.isnan(column).sum()
+
+    def _refresh_member(self, position):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            trust_rows, trust_columns = self._trust_rows(np.array([position]))
+        trust_row, trust_column = trust_rows[0], trust_columns[0]
+        trust_row[position] = trust_column[position] = 0.0
+        self._patch_sums(self.trust, self.trust_sum, self.trust_nan, position, trust_row, trust_column)
+
+        n = len(self.members)
+        similarity_row = np.clip(self.normalized[:n] @ self.normalized[position], -1, 1)
+        self._patch_sums(self.similarity, self.similarity_sum, self.similarity_nan, position,
+                         similarity_row, similarity_row)
+
+        self.updates_since_resync += 1
+        if self.updates_since_resync > max(len(self.members), 64):
+            self.resync()
+
+    def add_member(self, member, ratings):
+        if member in self.positions:
+            return self.update_member(member, ratings)
+        if len(self.members) == self.capacity:
+            self._grow()
+
+        position = len(self.members)
+        self.members.append(member)
+        self.positions[member] = position
+
+        n = len(self.members)
+        self.trust[position, :n] = self.trust[:n, position] = 0.0
+        self.similarity[position, :n] = self.similarity[:n, position] = 0.0
+        self.trust_sum[position] = self.similarity_sum[position] = 0.0
+        self.trust_nan[position] = self.similarity_nan[position] = 0
+        self._set_ratings(position, ratings)
+        self._refresh_member(position)
+
+    def update_member(self, member, ratings):
+        position = self.positions[member]
+        self._set_ratings(position, ratings)
+        self._refresh_member(position)
+
+    def remove_member(self, member):
+        position = self.positions.pop(member)
+        n = len(self.members)
+        last = n - 1
+
+        # 先從其他成員的欄總和扣除此成員的列
+        for matrix, sums, nan_counts in ((self.trust, self.trust_sum, self.trust_nan),
+                                         (self.similarity, self.similarity_sum, self.similarity_nan)):
+            row = matrix[position, :n]
+            sums[:n] -= np.where(np.isnan(row), 0.0, row)
+            nan_counts[:n] -= np.isnan(row)
+
+        # 將最後一位成員搬到空出的位置
+        if position != last:
+            moved = self.members[last]
+            self.members[position] = moved
+            self.positions[moved] = position
+            for array in (self.ratings, self.rated, self.normalized):
+                array[position] = array[last]
+            for matrix in (self.trust, self.similarity):
+                matrix[position, :n] = matrix[last, :n]
+                matrix[:n, position] = matrix[:n, last]
+                matrix[position, position] = matrix[last, last]
+            for array in (self.trust_sum, self.similarity_sum, self.trust_nan, self.similarity_nan):
+                array[position] = array[last]
+        self.members.pop()
+
+    def _set_ratings(self, position, ratings):
+        ratings = np.asarray(ratings, dtype=float)
+        self.ratings[position] = ratings
+        self.rated[position] = ratings > 0
+        self.normalized[position] = self._normalize(ratings)
+
+    def sync(self, group):
+        """
+        Apply the difference between the current state and `group` (members' ratings indexed by user id).
+
+        Returns:
+            changes (int): number of members added, removed or updated.
+        """
+        incoming = {member: row for member, row in zip(group.index, group.to_numpy(dtype=float))}
+        changes = 0
+        for member in [member for member in self.members if member not in incoming]:
+            self.remove_member(member)
+            changes += 1
+        for member, ratings in incoming.items():
+            position = self.positions.get(member)
+            if position is None:
+                self.add_member(member, ratings)
+                changes += 1
+            elif not np.array_equal(self.ratings[position], ratings, equal_nan=True):
+                self.update_member(member, ratings)
+                changes += 1
+        return changes
+
+    def leader(self):
+        """
+        Same leader selection as FindLeader.identify_leader, from the maintained column sums.
+
+        Returns:
+            leader_position (int), leader_impact (float), sorted_positions (ndarray)
+        """
+        n = len(self.members)
+        trust_sum = np.where(self.trust_nan[:n] > 0, np.nan, self.trust_sum[:n]) - 1
+        similarity_sum = np.where(self.similarity_nan[:n] > 0, np.nan, self.similarity_sum[:n]) - 1
+        ts_sumation = trust_sum + similarity_sum
+
+        sorted_positions = rank_members(ts_sumation, self.members)
+        leader_position = sorted_positions[0]
+        leader_impact = ts_sumation[leader_position] / (n - 1)
+
+        return leader_position, leader_impact, sorted_positions
+
+    def matrices(self):
+        """
+        Views of the current ratings, trust and similarity matrices.
+        """
+        n = len(self.members)
+        return self.ratings[:n], self.trust[:n, :n], self.similarity[:n, :n]
@@ -0,0 +1,138 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+
+
+class PoolTimeout(pool.PoolError):
+    pass
+
+
+class DatabasePool:
+    """
+    Bounded, thread-safe psycopg2 connection pool shared by the services.
+
+    Each request checks a connection out with `with db_pool.connection() as conn:`.
+    Connections idle for longer than `health_check_interval` are pinged before
+    being handed out, and connections that fail (on the ping or while in use)
+    are closed and replaced, so a database restart does not take the service down.
+    """
+
+    def __init__(self, db_config, minconn=1, maxconn=10, checkout_timeout=30, health_check_interval=30):
+        self.db_config = db_config
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, **db_config)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'reconnects': 0,
+            'health_check_failures': 0,
+            'max_in_use': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _getconn(self):
+        # 資料庫重啟後池中每條閒置連線都失效：逐一丟棄，最多 maxconn 條後還會拿到一條新連線
+        attempts = self.maxconn + 1
+        for _ in range(attempts):
+            conn = self._pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            with self._lock:
+                self._stats['health_check_failures'] += 1
+                self._stats['reconnects'] += 1
+            self._discard(conn)
+        raise psycopg2.OperationalError(f"no healthy database connection after {attempts} attempts")
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of the `with` block.
+
+        Raises:
+            PoolTimeout: no connection became free within `checkout_timeout` seconds.
+        """
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PoolTimeout(f"no database connection available within {self.checkout_timeout}s")
+        waited = time.perf_counter() - started
+
+        try:
+            conn = self._getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            self._stats['max_in_use'] = max(self._stats['max_in_use'], self._in_use)
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                if broken:
+                    self._stats['reconnects'] += 1
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                # putconn 會 rollback 未結束的交易
+                self._pool.putconn(conn)
+            self._slots.release()
+
+    def stats(self):
+        """
+        Pool utilization and checkout wait-time counters.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_use'] = self._in_use
+        stats['max_size'] = self.maxconn
+        stats['utilization'] = stats['in_use'] / self.maxconn
+        stats['wait_seconds_avg'] = stats['wait_seconds_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+    def close(self):
+        if not self._pool.closed:
+            self._pool.closeall()
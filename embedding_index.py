@@ -0,0 +1,139 @@
+import numpy as np
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class PreferenceEmbeddingIndex:
+    """
+    Dense float32 embeddings of every catalog row and of the known category/preference texts.
+
+    A truncated SVD of the TF-IDF matrix, with the food category documents
+    appended as extra rows, maps restaurants and queries into one low-rank
+    space, so scoring candidates is a single dense matrix-vector product.
+    Texts passed as `category_texts` or `lookup_texts` are embedded once up
+    front; other query texts are projected through the SVD components.
+    """
+
+    def __init__(self, scoring_index, category_texts, lookup_texts=(), dimensions=128, random_state=0):
+        """
+        Parameters:
+            scoring_index (TfidfScoringIndex): fitted index of the same snapshot.
+            category_texts (list): one document per food category, folded into the SVD.
+            lookup_texts (list): extra texts (e.g. single category terms) to precompute.
+            dimensions (int): embedding size, capped below the vocabulary size.
+        """
+        self.scoring_index = scoring_index
+        self.size = scoring_index.size
+        self.components = None
+        self.embeddings = None
+        self.lookup = {}
+        self.lookup_table = None
+
+        matrix = scoring_index.matrix
+        if matrix is None:
+            return
+        dimensions = min(dimensions, matrix.shape[1] - 1)
+        if dimensions < 1:
+            return
+
+        category_matrix = scoring_index.transform(list(category_texts))
+        svd = TruncatedSVD(n_components=dimensions, random_state=random_state)
+        svd.fit(sparse.vstack([matrix, category_matrix]).tocsr())
+
+        # (vocabulary, dimensions)：查詢向量乘上它即投影到同一個低維空間
+        self.components = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+        self.embeddings = np.ascontiguousarray(_normalize(np.asarray(matrix @ self.components)), dtype=np.float32)
+
+        texts = list(dict.fromkeys([*category_texts, *lookup_texts]))
+        self.lookup = {text: row for row, text in enumerate(texts)}
+        self.lookup_table = self.project(texts)
+
+    def updated(self, scoring_index, reused):
+        """
+        An index over a changed catalog that keeps this index's SVD components and query lookup.
+
+        Parameters:
+            scoring_index (TfidfScoringIndex): the new catalog's index, updated from this one's.
+            reused (ndarray): for every row of the new catalog, its row in this index, or -1 for
+                rows that were added or modified; only those are projected.
+        """
+        index = self.__class__.__new__(self.__class__)
+        index.scoring_index = scoring_index
+        index.size = scoring_index.size
+        index.components = self.components
+        index.lookup = self.lookup
+        index.lookup_table = self.lookup_table
+
+        reused = np.asarray(reused)
+        fresh = np.flatnonzero(reused < 0)
+        embeddings = self.embeddings[np.where(reused < 0, 0, reused)]
+        if len(fresh):
+            projected = np.asarray(scoring_index.matrix[fresh] @ self.components)
+            embeddings[fresh] = _normalize(projected)
+        index.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        return index
+
+    @property
+    def available(self):
+        return self.embeddings is not None
+
+    def project(self, texts):
+        vectors = np.asarray(self.scoring_index.transform(texts) @ self.components)
+        return np.ascontiguousarray(_normalize(vectors), dtype=np.float32)
+
+    def embed(self, texts):
+        """
+        Unit-length embeddings of `texts`, shape (len(texts), dimensions); empty texts embed to zeros.
+        """
+        vectors = np.empty((len(texts), self.components.shape[1]), dtype=np.float32)
+        missing = []
+        for number, text in enumerate(texts):
+            row = self.lookup.get(text)
+            if row is None:
+                missing.append(number)
+            else:
+                vectors[number] = self.lookup_table[row]
+        if missing:
+            vectors[missing] = self.project([texts[number] for number in missing])
+        return vectors
+
+    def scores(self, query_vectors, positions=None):
+        """
+        Parameters:
+            query_vectors (ndarray): shape (n_queries, dimensions).
+            positions (array): catalog rows to score, all rows when None.
+
+        Returns:
+            scores (ndarray): shape (len(positions), n_queries).
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32).T
+        if positions is None:
+            return self.embeddings @ query_vectors
+        positions = np.asarray(positions)
+        if len(positions) * 3 >= len(self.embeddings):
+            # 取出候選列會複製整塊 (候選數, 維度) 矩陣，比乘完整個矩陣再取列還慢
+            return (self.embeddings @ query_vectors)[positions]
+        return self.embeddings[positions] @ query_vectors
+
+    def to_arrays(self):
+        if not self.available:
+            return {}, {'size': self.size, 'lookup': []}
+        arrays = {'components': self.components, 'embeddings': self.embeddings, 'lookup_table': self.lookup_table}
+        return arrays, {'size': self.size, 'lookup': list(self.lookup)}
+
+    @classmethod
+    def from_arrays(cls, arrays, meta, scoring_index):
+        index = cls.__new__(cls)
+        index.scoring_index = scoring_index
+        index.size = meta['size']
+        index.components = arrays.get('components')
+        index.embeddings = arrays.get('embeddings')
+        index.lookup_table = arrays.get('lookup_table')
+        index.lookup = {text: row for row, text in enumerate(meta['lookup'])}
+        return index
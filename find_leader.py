@@ -1,7 +1,11 @@
-import psycopg2
+import hashlib
 import numpy as np
 import pandas as pd
 from scipy.spatial import distance
+from cache import LRUCache
+from chatroom_state import ChatroomMatrixState, rank_members
+from db_pool import DatabasePool
+from metrics import REGISTRY
 
 column_mapping = {
     "american": "美式",
@@ -21,12 +25,19 @@ column_mapping = {
 }
 
 class FindLeader:
-    def __init__(self, db_config):
-        self.conn = psycopg2.connect(**db_config)
+    def __init__(self, db_config, db_pool=None, cache_size=1024, cache_ttl=300, state_cache_size=1024, metrics=None):
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.owns_pool = db_pool is None
+        self.db_pool = db_pool if db_pool is not None else DatabasePool(db_config)
+        # (chatroom_id, preference fingerprint) -> (leader_id, top_3_preferences, opinion_weight)
+        self.result_cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        # chatroom_id -> ChatroomMatrixState, 成員異動時只更新受影響的列與欄
+        self.chatroom_states = LRUCache(maxsize=state_cache_size)
+        self.metrics.add_collector(self.collect_metrics)
     
     def __del__(self):
-        if self.conn:
-            self.conn.close()
+        if getattr(self, 'owns_pool', False):
+            self.db_pool.close()
 
     def get_user_preference(self, chatroom_id):
         """
@@ -35,26 +46,142 @@ class FindLeader:
         Returns:
             rows (DataFrame): group members' preference
         """
-        cur = self.conn.cursor()
+        sql = """
+        SELECT cp.user_id, up.american, up.bar, up.chinese, up.dessert, up.exotic,
+            up.french, up.hongkong, up.italian, up.japanese, up.korean,
+            up."southeastAsian", up.thai, up.vietnamese, up.western
+        FROM chatroom_participant cp
+        JOIN user_preference up ON cp.user_id = up.user_id
+        WHERE cp.chatroom_id = %s
+        """
+
+        with self.db_pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, (str(chatroom_id),))
 
-        sql = f"""
+            column_name = [desc[0] for desc in cur.description] # get column name
+            records = cur.fetchall()
+            cur.close()
+
+        return self.preference_frame(column_name, records)
+
+    async def get_user_preference_async(self, chatroom_id, async_db_pool):
+        """
+        get_user_preference over an AsyncDatabasePool, for the async serving mode.
+        """
+        sql = """
         SELECT cp.user_id, up.american, up.bar, up.chinese, up.dessert, up.exotic,
             up.french, up.hongkong, up.italian, up.japanese, up.korean,
             up."southeastAsian", up.thai, up.vietnamese, up.western
         FROM chatroom_participant cp
         JOIN user_preference up ON cp.user_id = up.user_id
-        WHERE cp.chatroom_id = '{chatroom_id}'
+        WHERE cp.chatroom_id = $1
         """
+        columns = ['user_id', *column_mapping]
 
-        cur.execute(sql)
+        # 參數沿用欄位本身的型別，chatroom_id 的索引才用得上
+        parameter_type, = await async_db_pool.parameter_types(sql)
+        chatroom_id = self.chatroom_id_argument(chatroom_id, parameter_type)
+        if chatroom_id is None:
+            return self.preference_frame(columns, [])
 
-        column_name = [desc[0] for desc in cur.description] # get column name
-        rows = pd.DataFrame(cur.fetchall(), columns=column_name)
+        column_name, records = await async_db_pool.fetch(sql, chatroom_id, columns=columns)
 
-        rows.rename(columns=column_mapping, inplace=True)
+        return self.preference_frame(column_name, records)
 
+    def chatroom_id_argument(self, chatroom_id, parameter_type):
+        """
+        chatroom_id converted for an asyncpg parameter of Postgres type `parameter_type`
+        (an element type for array parameters); None when it cannot match any chatroom.
+        """
+        if parameter_type.lstrip('_') in ('int2', 'int4', 'int8'):
+            try:
+                return int(chatroom_id)
+            except ValueError:
+                return None
+        return str(chatroom_id)
+
+    def preference_frame(self, column_name, records):
+        rows = pd.DataFrame(records, columns=column_name)
+        rows.rename(columns=column_mapping, inplace=True)
         return rows
 
+    def get_user_preferences(self, chatroom_ids):
+        """
+        Get the members' preferences of several chatrooms in a single query.
+
+        Parameters:
+            chatroom_ids (list): chatroom ids to fetch.
+
+        Returns:
+            groups (dict): chatroom_id -> DataFrame shaped like get_user_preference's result
+                (empty for chatrooms without members).
+        """
+        chatroom_ids = [str(chatroom_id) for chatroom_id in chatroom_ids]
+        if not chatroom_ids:
+            return {}
+
+        sql = """
+        SELECT cp.chatroom_id, cp.user_id, up.american, up.bar, up.chinese, up.dessert, up.exotic,
+            up.french, up.hongkong, up.italian, up.japanese, up.korean,
+            up."southeastAsian", up.thai, up.vietnamese, up.western
+        FROM chatroom_participant cp
+        JOIN user_preference up ON cp.user_id = up.user_id
+        WHERE cp.chatroom_id IN %s
+        """
+
+        with self.db_pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, (tuple(chatroom_ids),))
+
+            column_name = [desc[0] for desc in cur.description] # get column name
+            records = cur.fetchall()
+            cur.close()
+
+        return self.split_preferences(self.preference_frame(column_name, records), chatroom_ids)
+
+    async def get_user_preferences_async(self, chatroom_ids, async_db_pool):
+        """
+        get_user_preferences over an AsyncDatabasePool, for the async serving mode.
+        """
+        chatroom_ids = [str(chatroom_id) for chatroom_id in chatroom_ids]
+        if not chatroom_ids:
+            return {}
+
+        sql = """
+        SELECT cp.chatroom_id, cp.user_id, up.american, up.bar, up.chinese, up.dessert, up.exotic,
+            up.french, up.hongkong, up.italian, up.japanese, up.korean,
+            up."southeastAsian", up.thai, up.vietnamese, up.western
+        FROM chatroom_participant cp
+        JOIN user_preference up ON cp.user_id = up.user_id
+        WHERE cp.chatroom_id = ANY($1)
+        """
+        columns = ['chatroom_id', 'user_id', *column_mapping]
+
+        parameter_type, = await async_db_pool.parameter_types(sql)
+        arguments = [self.chatroom_id_argument(chatroom_id, parameter_type) for chatroom_id in chatroom_ids]
+        arguments = [argument for argument in arguments if argument is not None]
+        if arguments:
+            column_name, records = await async_db_pool.fetch(sql, arguments, columns=columns)
+        else:
+            column_name, records = columns, []
+
+        return self.split_preferences(self.preference_frame(column_name, records), chatroom_ids)
+
+    def split_preferences(self, rows, chatroom_ids):
+        """
+        Split rows of several chatrooms (with a 'chatroom_id' column) into one DataFrame per requested chatroom.
+        """
+        rows['chatroom_id'] = rows['chatroom_id'].astype(str)
+
+        groups = {
+            chatroom_id: group.drop(columns='chatroom_id').reset_index(drop=True)
+            for chatroom_id, group in rows.groupby('chatroom_id', sort=False)
+        }
+        empty = rows.drop(columns='chatroom_id').iloc[0:0]
+
+        return {chatroom_id: groups.get(chatroom_id, empty.copy()) for chatroom_id in chatroom_ids}
+
 
     # Function to calculate trust matrix based on common rated items and ratings distance
     def calculate_trust(self, Group):
@@ -68,35 +195,24 @@ class FindLeader:
             Trust_matrix (DataFrame): The trust matrix representing the trust levels between members.
         """
         members = Group.index
-        no_member = len(members)
-    
-        Trust_matrix = pd.DataFrame(0.0, index=members, columns=members)
-    
-        for u in members:
-            rated_list_u = Group.loc[u].index[Group.loc[u] > 0]
-            count_rated_u = len(rated_list_u)
-            ratings_u = Group.loc[u][:]
-        
-            for v in members:
-                if u == v:
-                    continue
-            
-                rated_list_v = Group.loc[v].index[Group.loc[v] > 0]
-                count_rated_v = len(rated_list_v)
-                ratings_v = Group.loc[v][:]
-            
-                # 找到 u, v 評分項目的交集
-                intersection_uv = set(rated_list_u).intersection(rated_list_v)
-                count_intersection = len(intersection_uv)
-            
-                partnership_uv = count_intersection / count_rated_u
-            
-                dst_uv = 1 / (1 + distance.euclidean(ratings_u, ratings_v))
-            
-                trust_uv = (2 * partnership_uv * dst_uv) / (partnership_uv + dst_uv)
-
-                Trust_matrix.at[u, v] = trust_uv
-            
+        ratings = Group.to_numpy(dtype=float)
+
+        # 評分項目 (> 0) 的遮罩，交集數量即為布林矩陣乘積
+        rated = (ratings > 0).astype(float)
+        count_rated = rated.sum(axis=1)
+        count_intersection = rated @ rated.T
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            partnership = count_intersection / count_rated[:, np.newaxis]
+
+            dst = 1 / (1 + distance.cdist(ratings, ratings, 'euclidean'))
+
+            trust = (2 * partnership * dst) / (partnership + dst)
+
+        np.fill_diagonal(trust, 0.0)
+
+        Trust_matrix = pd.DataFrame(trust, index=members, columns=members)
+
         return Trust_matrix
 
     # Function to calculate Pearson correlation coefficient similarity between members
@@ -140,41 +256,47 @@ class FindLeader:
         similarity_sum = np.sum(Similarity_matrix.values, axis=0) - 1
         ts_sumation = trust_sum + similarity_sum
 
-        # sort ts_sumation in descending order
-        sorted_ts_sumation = np.argsort(ts_sumation)[::-1]  # [::-1] makes it descending
+        # sort ts_sumation in descending order, ties (and nan) by user id
+        sorted_ts_sumation = rank_members(ts_sumation, Trust_matrix.index.tolist())
 
         # Get the sorted user IDs and their corresponding impact scores
         sorted_ids = Trust_matrix.index[sorted_ts_sumation]
 
         # The ID with the highest score (leader)
-        LeaderId = np.argmax(ts_sumation)
+        LeaderId = sorted_ts_sumation[0]
 
         LeaderImpact = ts_sumation[LeaderId] / (total_members - 1)
 
         return Trust_matrix.index[LeaderId], LeaderImpact, sorted_ids.tolist()
 
 
-    # Function to calculate influence weight based on leader's impact, similarity, and trust
-    def calculate_influence_weight(self, leader_id, leader_impact, similarity_uv, trust_uv, v):
+    # Function to calculate influence weights between every pair of members at once
+    def calculate_influence_weights(self, members, leader_id, leader_impact, similarity, trust):
         """
-        Calculate the influence weight based on leader's impact, similarity, and trust.
+        Influence weights between every pair of members: weight_uv = s_uv * t_uv / (s_uv + t_uv),
+        and (1/2) * (leader_impact + s_uv * t_uv) / (s_uv + t_uv) when v is the leader.
 
         Parameters:
+            members (Index): Member IDs, in the order of the matrix rows and columns.
             leader_id (int): ID of the identified leader.
             leader_impact (float): Impact value of the identified leader on group preferences.
-            similarity_uv (float): Similarity score between two members.
-            trust_uv (float): Trust score between two members.
-            v (int): ID of the member being considered.
+            similarity (ndarray): PCC similarity matrix between group members.
+            trust (ndarray): Trust matrix between group members.
 
         Returns:
-            weight_uv (float): Calculated influence weight.
+            weights (ndarray): weights[u, v] is the influence weight of member v on member u (0 on the diagonal).
         """
-        if v == leader_id:
-            weight_uv = (1/2) * ((leader_impact + (similarity_uv * trust_uv)) / (similarity_uv + trust_uv))
-        else:
-            weight_uv = (similarity_uv * trust_uv) / (similarity_uv + trust_uv)
-        
-        return weight_uv
+        is_leader = np.asarray(members == leader_id)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            product = similarity * trust
+            total = similarity + trust
+            weights = product / total
+            weights[:, is_leader] = (1/2) * ((leader_impact + product[:, is_leader]) / total[:, is_leader])
+
+        np.fill_diagonal(weights, 0.0)
+
+        return weights
 
     # Function to calculate influenced ratings for group members and items
     def influenced_rating(self, group):
@@ -191,7 +313,7 @@ class FindLeader:
         """
         members = group.index
         items = group.columns
-        num_members, num_items = len(members), len(items)
+        num_members = len(members)
 
         # Calculate trust and similarity matrices
         trust_matrix = self.calculate_trust(group)
@@ -200,27 +322,43 @@ class FindLeader:
         # Identify the leader and their impact
         leader_id, leader_impact, sorted_ids = self.identify_leader(trust_matrix, similarity_matrix, num_members)
 
-        influenced_ratings = pd.DataFrame(0.0, index=members, columns=items)
+        ratings = group.to_numpy(dtype=float)
+        weights = self.calculate_influence_weights(
+            members, leader_id, leader_impact, similarity_matrix.to_numpy(dtype=float), trust_matrix.to_numpy(dtype=float))
+
+        influenced = self.influenced_rating_matrix(ratings, weights)
 
-        for u in members:
-            for i in items:
-                score_ui = group.at[u, i]
-                influence = 0
+        influenced_ratings = pd.DataFrame(influenced, index=members, columns=items)
 
-                if score_ui > 0:
-                    for v in members:
-                        if v != u:
-                            score_vi = group.at[v, i]
-                            similarity_uv = similarity_matrix.at[u, v]
-                            trust_uv = trust_matrix.at[u, v]
-                            weight_vu = self.calculate_influence_weight(leader_id, leader_impact, similarity_uv, trust_uv, v)
+        return leader_id, influenced_ratings, sorted_ids
 
-                            if score_vi > 0:
-                                influence += weight_vu * (score_vi - score_ui)
+    def influenced_rating_matrix(self, ratings, weights):
+        """
+        influenced[u, i] = r_ui + sum over v != u with r_vi > 0 of weights[u, v] * (r_vi - r_ui),
+        for every item u has rated (r_ui > 0); 0 elsewhere.
+
+        Parameters:
+            ratings (ndarray): members x items ratings.
+            weights (ndarray): members x members influence weights, 0 on the diagonal.
 
-                    influenced_ratings.at[u, i] = score_ui + influence
+        Returns:
+            influenced (ndarray): members x items influenced ratings.
+        """
+        rated = ratings > 0
+
+        if np.isfinite(weights).all():
+            # sum_v w_uv * r_vi - r_ui * sum_v w_uv，兩者都只計入 r_vi > 0 的成員
+            rated_ratings = np.where(rated, ratings, 0.0)
+            influence = weights @ rated_ratings - ratings * (weights @ rated.astype(float))
+        else:
+            # 權重含 nan/inf 時逐項相乘，只有 r_vi > 0 的項會傳遞 nan，與逐一計算的結果相同
+            with np.errstate(invalid='ignore'):
+                contributions = weights[:, :, np.newaxis] * (ratings[np.newaxis, :, :] - ratings[:, np.newaxis, :])
+            contributions = np.where(rated[np.newaxis, :, :], contributions, 0.0)
+            np.einsum('uui->ui', contributions)[:] = 0.0
+            influence = contributions.sum(axis=1)
 
-            return leader_id, influenced_ratings, sorted_ids
+        return np.where(rated, ratings + influence, 0.0)
 
     # Function to calculate opinion weight through sorted_ids
     def calculate_opinion_weight(self, sorted_ids):
@@ -240,15 +378,167 @@ class FindLeader:
         return opinion_weight
 
     def main(self, chatroom_id):
-        group = self.get_user_preference(chatroom_id)
+        with self.metrics.timer('leader.fetch'):
+            group = self.get_user_preference(chatroom_id)
 
+        return self.cached_analyze_group(chatroom_id, group)
+
+    def main_batch(self, chatroom_ids):
+        """
+        Run main for several chatrooms, fetching all their preferences in one query.
+
+        Returns:
+            results (list): one (chatroom_id, result, error) tuple per chatroom, where result is
+                main's (leader_id, top_3_preferences, opinion_weight) or None when error is set.
+        """
+        with self.metrics.timer('leader.fetch_batch'):
+            groups = self.get_user_preferences(chatroom_ids)
+
+        return self.analyze_groups(groups)
+
+    def analyze_groups(self, groups):
+        """
+        cached_analyze_group for each chatroom_id -> group of `groups`, collecting errors per chatroom.
+        """
+        results = []
+        for chatroom_id, group in groups.items():
+            if group.empty:
+                results.append((chatroom_id, None, ValueError("chatroom has no members with preferences")))
+                continue
+            try:
+                results.append((chatroom_id, self.cached_analyze_group(chatroom_id, group), None))
+            except Exception as e:
+                results.append((chatroom_id, None, e))
+
+        return results
+
+    def preference_fingerprint(self, group):
+        """
+        Digest of a group's membership and preference rows, independent of row order.
+        """
+        rows = group.sort_values('user_id').reset_index(drop=True)
+        hashed = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+        columns = '\x1f'.join(map(str, rows.columns)).encode('utf-8')
+        return hashlib.blake2b(hashed.tobytes() + columns, digest_size=16).hexdigest()
+
+    def cached_analyze_group(self, chatroom_id, group):
+        """
+        analyze_chatroom, reusing the previous result while the chatroom's members and their preferences are unchanged.
+        """
+        with self.metrics.timer('leader.fingerprint'):
+            key = (str(chatroom_id), self.preference_fingerprint(group))
+        result = self.result_cache.get(key)
+        self.metrics.increment('leader_result_cache_lookups_total', result='miss' if result is None else 'hit')
+        if result is None:
+            result = self.analyze_chatroom(chatroom_id, group)
+            self.result_cache.set(key, result)
+        return result
+
+    def invalidate_chatroom(self, chatroom_id):
+        """
+        Drop cached results of a chatroom, e.g. after a member joins, leaves or updates their preferences.
+        """
+        chatroom_id = str(chatroom_id)
+        return self.result_cache.invalidate(lambda key: key[0] == chatroom_id)
+
+    def clear_cache(self):
+        self.result_cache.clear()
+        self.chatroom_states.clear()
+
+    def collect_metrics(self):
+        samples = [('leader_result_cache', {'stat': name}, value) for name, value in self.result_cache.stats().items()]
+        samples.append(('leader_chatroom_states', {}, len(self.chatroom_states)))
+        return samples
+
+    def chatroom_state(self, chatroom_id, group):
+        """
+        The chatroom's matrix state for `group` (members' ratings indexed by user id), rebuilt only
+        when there is none yet or most of the members changed. Callers sync it with `group` and read
+        it within one `with state.lock:` block, since other requests may sync it to another version.
+        """
+        chatroom_id = str(chatroom_id)
+        state = self.chatroom_states.get(chatroom_id)
+        if state is not None:
+            with state.lock:
+                if state.items == list(group.columns) and abs(len(group) - len(state)) <= len(group) // 2:
+                    return state
+
+        state = ChatroomMatrixState.from_group(group)
+        self.chatroom_states.set(chatroom_id, state)
+        return state
+
+    def group_profile(self, chatroom_id, group):
+        """
+        cached_analyze_group's result together with the group's preference vector.
+
+        Returns:
+            result (tuple): (leader_id, top_3_preferences, opinion_weight), as returned by main.
+            preference_vector (Series): item -> members' influenced ratings averaged with their opinion weights.
+        """
+        with self.metrics.timer('leader.fingerprint'):
+            key = (str(chatroom_id), self.preference_fingerprint(group), 'profile')
+        profile = self.result_cache.get(key)
+        self.metrics.increment('leader_result_cache_lookups_total', result='miss' if profile is None else 'hit')
+        if profile is None:
+            leader_id, influenced, sorted_ids = self.influenced_preferences(chatroom_id, group)
+            profile = (self.summarize(leader_id, influenced, sorted_ids),
+                       self.group_preference_vector(influenced, sorted_ids))
+            self.result_cache.set(key, profile)
+        return profile
+
+    def group_preference_vector(self, influenced, sorted_ids):
+        """
+        Items' influenced ratings averaged over members with calculate_opinion_weight's (unrounded) weights.
+        """
+        total_users = len(sorted_ids)
+        raw_weights = np.arange(total_users, 0, -1, dtype=float)
+        return pd.Series(raw_weights / raw_weights.sum() @ influenced.loc[sorted_ids].to_numpy(),
+                         index=influenced.columns)
+
+    def influenced_preferences(self, chatroom_id, group):
+        """
+        Leader, influenced ratings (members x items DataFrame) and members sorted by impact,
+        from the chatroom's incrementally maintained trust/similarity state.
+        """
         # remove 'user_id' 列，並將其設為 index
-        group.set_index('user_id', inplace=True)
+        group = group.set_index('user_id')
+
+        with self.metrics.timer('leader.state_build'):
+            state = self.chatroom_state(chatroom_id, group)
+        # 同步與計算在同一段鎖內，避免其他請求在中間把 state 同步成另一個版本
+        with state.lock:
+            with self.metrics.timer('leader.state_sync'):
+                state.sync(group)
+            ratings, trust, similarity = state.matrices()
+            members = pd.Index(state.members)
+
+            with self.metrics.timer('leader.identify'):
+                leader_position, leader_impact, sorted_positions = state.leader()
+            leader_id = members[leader_position]
+            sorted_ids = members[sorted_positions].tolist()
+
+            with self.metrics.timer('leader.influence'):
+                weights = self.calculate_influence_weights(members, leader_id, leader_impact, similarity, trust)
+                influenced = self.influenced_rating_matrix(ratings, weights)
+
+        return leader_id, pd.DataFrame(influenced, index=members, columns=state.items), sorted_ids
 
-        leader_id, influenced_ratings, sorted_ids = self.influenced_rating(group)
+    def analyze_chatroom(self, chatroom_id, group):
+        """
+        Find the leader, top 3 preferences and opinion weights of a group, from the chatroom's
+        incrementally maintained trust/similarity state.
+
+        Parameters:
+            group (DataFrame): members' preferences with a 'user_id' column, as returned by get_user_preference.
+
+        Returns:
+            leader_id, top_3_preferences (list), opinion_weight (list)
+        """
+        return self.summarize(*self.influenced_preferences(chatroom_id, group))
 
+    def summarize(self, leader_id, influenced, sorted_ids):
         # aggregate group's ratings
-        avg_influenced_ratings = influenced_ratings.mean()
+        avg_influenced_ratings = influenced.mean()
         top_3_preferences = avg_influenced_ratings.nlargest(3).index.to_list()
 
         # get member's opinion weight
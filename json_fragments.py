@@ -0,0 +1,46 @@
+class RawJSON(bytes):
+    """
+    An already encoded JSON value, spliced into responses as is.
+    """
+
+
+class FragmentEncoder:
+    """
+    Encodes response payloads the way jsonify does (sorted keys, ASCII
+    escapes, compact separators) while copying RawJSON fragments verbatim,
+    so values encoded once can be reused across responses.
+    """
+
+    def __init__(self, dumps):
+        """
+        Parameters:
+            dumps (callable): dumps(value) -> str for plain JSON values, e.g. a Flask app's json.dumps.
+        """
+        self.dumps = dumps
+
+    def encode(self, value):
+        parts = []
+        self._encode(value, parts)
+        return b''.join(parts)
+
+    def _encode(self, value, parts):
+        if isinstance(value, RawJSON):
+            parts.append(value)
+        elif isinstance(value, dict):
+            parts.append(b'{')
+            for number, key in enumerate(sorted(value)):
+                if number:
+                    parts.append(b',')
+                parts.append(self.dumps(key).encode('utf-8'))
+                parts.append(b':')
+                self._encode(value[key], parts)
+            parts.append(b'}')
+        elif isinstance(value, (list, tuple)):
+            parts.append(b'[')
+            for number, item in enumerate(value):
+                if number:
+                    parts.append(b',')
+                self._encode(item, parts)
+            parts.append(b']')
+        else:
+            parts.append(self.dumps(value).encode('utf-8'))
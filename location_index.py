@@ -0,0 +1,155 @@
+import re
+from collections import defaultdict
+
+import numpy as np
+
+# 台灣地址：[郵遞區號]縣市 + 鄉鎮市區
+REGION_PATTERN = re.compile(r'^\d{0,6}\s*(?P<city>.{1,4}?[市縣])(?P<district>.{1,4}?[區鄉鎮市])')
+
+
+def extract_region(address):
+    """
+    Split the city and district off the front of a Taiwanese address.
+
+    Returns:
+        (city, district), either of which may be None.
+    """
+    match = REGION_PATTERN.match(address or '')
+    if not match:
+        return None, None
+    return match.group('city'), match.group('district')
+
+
+class LocationIndex:
+    """
+    Character n-gram inverted index over lower-cased restaurant addresses.
+
+    `lookup` returns exactly the rows whose address contains the query, the
+    same result as `location.lower() in address.lower()` per row, but only
+    the rows sharing every n-gram of the query are ever compared. Results for
+    the cities and districts found in the catalog are precomputed.
+    """
+
+    def __init__(self, addresses, n=2):
+        self.n = n
+        self.size = len(addresses)
+        self.addresses = [(address or '').lower() for address in addresses]
+
+        postings = defaultdict(list)
+        regions = set()
+        for row, address in enumerate(self.addresses):
+            grams = set(address)
+            grams.update(address[i:i + n] for i in range(len(address) - n + 1))
+            for gram in grams:
+                postings[gram].append(row)
+
+            city, district = extract_region(address)
+            if city:
+                regions.add(city)
+            if district:
+                regions.add(district)
+            if city and district:
+                regions.add(city + district)
+
+        self.postings = {gram: np.asarray(rows, dtype=np.int32) for gram, rows in postings.items()}
+        self.regions = {}
+        self.regions = {region: self.lookup(region) for region in regions}
+
+    def to_arrays(self):
+        """
+        Postings and precomputed region results flattened into arrays, keys kept in the JSON metadata.
+        """
+        grams = list(self.postings)
+        regions = list(self.regions)
+        postings, posting_offsets = _flatten([self.postings[gram] for gram in grams])
+        region_rows, region_offsets = _flatten([self.regions[region] for region in regions])
+        arrays = {
+            'postings': postings,
+            'posting_offsets': posting_offsets,
+            'region_rows': region_rows,
+            'region_offsets': region_offsets,
+        }
+        meta = {'n': self.n, 'size': self.size, 'grams': grams, 'regions': regions}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta, addresses):
+        """
+        Parameters:
+            addresses (sequence): the lower-cased addresses, indexable by catalog position.
+        """
+        index = cls.__new__(cls)
+        index.n = meta['n']
+        index.size = meta['size']
+        index.addresses = addresses
+        index.postings = _unflatten(meta['grams'], arrays['postings'], arrays['posting_offsets'])
+        index.regions = _unflatten(meta['regions'], arrays['region_rows'], arrays['region_offsets'])
+        return index
+
+    def lookup(self, location):
+        """
+        Ascending catalog positions whose address contains `location` (case-insensitive).
+        """
+        query = location.lower()
+        if query in self.regions:
+            return self.regions[query]
+        if not query:
+            return np.arange(self.size)
+
+        if len(query) < self.n:
+            grams = set(query)
+        else:
+            grams = {query[i:i + self.n] for i in range(len(query) - self.n + 1)}
+
+        lists = []
+        for gram in grams:
+            rows = self.postings.get(gram)
+            if rows is None:
+                return np.empty(0, dtype=np.int32)
+            lists.append(rows)
+        lists.sort(key=len)
+
+        candidates = lists[0]
+        for rows in lists[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+
+        if len(query) <= self.n:
+            return candidates
+        addresses = self.addresses
+        return np.fromiter((row for row in candidates if query in addresses[row]), dtype=np.int32)
+
+
+def _flatten(lists):
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(rows) for rows in lists])
+    values = np.concatenate(lists).astype(np.int32) if lists else np.empty(0, dtype=np.int32)
+    return values, offsets
+
+
+def _unflatten(keys, values, offsets):
+    return {key: values[offsets[i]:offsets[i + 1]] for i, key in enumerate(keys)}
+
+
+class LowercaseAddresses:
+    """
+    Lower-cased view of an address column, decoded on access instead of copied up front.
+    """
+
+    def __init__(self, addresses):
+        self.addresses = addresses
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __getitem__(self, position):
+        return (self.addresses[position] or '').lower()
+
+
+def build_location_index(snapshot):
+    return LocationIndex(snapshot.column("address"))
+
+
+def load_location_index(snapshot, arrays, meta):
+    return LocationIndex.from_arrays(arrays, meta, LowercaseAddresses(snapshot.columns['address']))
@@ -0,0 +1,152 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 10, 20, 50, 100, 500, 1000, 5000, 10000, 50000, 100000, 1000000)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Minimal thread-safe metrics store rendered in the Prometheus text format.
+
+    Stage timers also feed the per-request profile of the current thread
+    when one was started with `start_profile`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._local = threading.local()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """
+        Record the duration of the `with` block in the `recommender_stage_seconds` histogram.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe('recommender_stage_seconds', elapsed, stage=stage, **labels)
+            profile = getattr(self._local, 'profile', None)
+            if profile is not None:
+                profile.append((stage, elapsed))
+
+    def add_collector(self, collector):
+        """
+        Register `collector() -> [(name, labels dict, value)]`, read as gauges at render time.
+        """
+        self._collectors.append(collector)
+
+    def start_profile(self):
+        self._local.profile = []
+
+    def stop_profile(self):
+        profile = getattr(self._local, 'profile', None)
+        self._local.profile = None
+        return profile or []
+
+    def render(self):
+        lines = []
+
+        def header(name, metric_type):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            histograms = [(key, histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                          for key, histogram in histograms]
+
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                header(name, "counter")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), buckets, counts, total, count in histograms:
+            if name not in seen:
+                header(name, "histogram")
+                seen.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (("le", _format_value(float(bound))),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                if name not in seen:
+                    header(name, "gauge")
+                    seen.add(name)
+                lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe('recommender_stage_seconds', "Time spent in each pipeline stage.")
+REGISTRY.describe('recommender_filter_candidates', "Candidate restaurants left after each filter.")
+REGISTRY.describe('recommender_requests_total', "HTTP requests by route and status.")
+REGISTRY.describe('recommender_request_seconds', "HTTP request latency by route.")
+REGISTRY.describe('recommender_response_cache_lookups_total', "Recommendation page cache lookups by result.")
+REGISTRY.describe('leader_result_cache_lookups_total', "Leader result cache lookups by result.")
@@ -0,0 +1,165 @@
+import numpy as np
+
+WEEKDAYS = ("一", "二", "三", "四", "五", "六", "日")
+DAY_INDEX = {day: index for index, day in enumerate(WEEKDAYS)}
+LAST_MINUTE = 24 * 60 - 1
+
+
+def parse_clock(text):
+    """
+    Convert "HH:MM" into minutes after midnight ("24:00" is read as the last minute of the day).
+    """
+    hour, minute = text.strip().split(':')
+    hour, minute = int(hour), int(minute)
+    if hour == 24 and minute == 0:
+        return LAST_MINUTE
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"time out of range: {text}")
+    return hour * 60 + minute
+
+
+def parse_day_hours(day_hours):
+    """
+    Parse one "星期一 11:00–14:30 17:00–21:00" entry of `opening_time`.
+
+    Returns:
+        day (int): weekday index, 0 for 星期一.
+        periods (list): (start_minute, end_minute) tuples, empty when closed.
+        errors (list): the time periods that could not be parsed.
+    """
+    day = DAY_INDEX.get(day_hours[2:3])
+    if day is None:
+        raise ValueError(f"unknown weekday in '{day_hours}'")
+
+    body = day_hours[3:]
+    if '休息' in body:
+        return day, [], []
+    if '24' in body and '小時營業' in body:
+        return day, [(0, LAST_MINUTE)], []
+
+    periods = []
+    errors = []
+    for time_period in body.split(' '):
+        time_period = time_period.strip()
+        if not time_period:
+            continue
+        try:
+            if "–" in time_period:
+                start, end = time_period.split('–')
+            elif "-" in time_period:
+                start, end = time_period.split('-')
+            elif "24" in time_period:
+                start, end = "00:00", "23:59"
+            else:
+                raise ValueError("unexpected time format")
+            periods.append((parse_clock(start), parse_clock(end)))
+        except ValueError:
+            errors.append(time_period)
+    return day, periods, errors
+
+
+class OpeningHoursIndex:
+    """
+    Opening hours of every catalog row compiled into flat per-weekday interval arrays.
+
+    Overnight periods (e.g. 22:00–02:00) are split at midnight and the tail is
+    attributed to the following weekday, so "open at day/time" is a single
+    vectorized comparison per query.
+    """
+
+    def __init__(self, opening_times):
+        self.size = len(opening_times)
+        self.parse_errors = []
+
+        intervals = []
+        for row, opening_time in enumerate(opening_times):
+            if not opening_time:
+                continue
+            for day_hours in opening_time.split(", "):
+                day_hours = day_hours.strip()
+                if not day_hours:
+                    continue
+                try:
+                    day, periods, errors = parse_day_hours(day_hours)
+                except ValueError:
+                    self.parse_errors.append((row, day_hours))
+                    continue
+                for time_period in errors:
+                    self.parse_errors.append((row, time_period))
+                for start, end in periods:
+                    if start <= end:
+                        intervals.append((day, start, end, row))
+                    else:
+                        intervals.append((day, start, LAST_MINUTE, row))
+                        intervals.append(((day + 1) % 7, 0, end, row))
+
+        intervals = np.asarray(intervals, dtype=np.int32).reshape(-1, 4)
+        days = intervals[:, 0].astype(np.int8)
+        starts = intervals[:, 1].astype(np.int16)
+        ends = intervals[:, 2].astype(np.int16)
+        rows = intervals[:, 3]
+
+        self.intervals = {}
+        for day in range(len(WEEKDAYS)):
+            selected = days == day
+            self.intervals[day] = (starts[selected], ends[selected], rows[selected])
+
+        if self.parse_errors:
+            samples = ', '.join(f"'{text}'" for _, text in self.parse_errors[:5])
+            print(f"Opening hours index: {len(self.parse_errors)} unparseable periods (e.g. {samples})")
+
+    def to_arrays(self):
+        """
+        Flat arrays (intervals grouped by weekday) and JSON metadata for CatalogStore.
+        """
+        days = range(len(WEEKDAYS))
+        day_offsets = np.zeros(len(WEEKDAYS) + 1, dtype=np.int64)
+        day_offsets[1:] = np.cumsum([len(self.intervals[day][0]) for day in days])
+        arrays = {
+            'starts': np.concatenate([self.intervals[day][0] for day in days]),
+            'ends': np.concatenate([self.intervals[day][1] for day in days]),
+            'rows': np.concatenate([self.intervals[day][2] for day in days]),
+            'day_offsets': day_offsets,
+        }
+        meta = {'size': self.size, 'parse_errors': self.parse_errors}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        index = cls.__new__(cls)
+        index.size = meta['size']
+        index.parse_errors = [tuple(error) for error in meta['parse_errors']]
+
+        day_offsets = arrays['day_offsets']
+        index.intervals = {}
+        for day in range(len(WEEKDAYS)):
+            selected = slice(day_offsets[day], day_offsets[day + 1])
+            index.intervals[day] = (arrays['starts'][selected], arrays['ends'][selected], arrays['rows'][selected])
+        return index
+
+    def open_mask(self, day, time):
+        """
+        Parameters:
+            day (str | int): weekday character ("一" ... "日") or index (0 for 星期一).
+            time (str | int): "HH:MM" or minutes after midnight.
+
+        Returns:
+            mask (ndarray): boolean array, True for rows open at that moment.
+        """
+        if isinstance(day, str):
+            day = DAY_INDEX[day]
+        if isinstance(time, str):
+            time = parse_clock(time)
+
+        starts, ends, rows = self.intervals[day]
+        mask = np.zeros(self.size, dtype=bool)
+        mask[rows[(starts <= time) & (time <= ends)]] = True
+        return mask
+
+
+def build_opening_hours_index(snapshot):
+    return OpeningHoursIndex(snapshot.column("opening_time"))
+
+
+def load_opening_hours_index(snapshot, arrays, meta):
+    return OpeningHoursIndex.from_arrays(arrays, meta)
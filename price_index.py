@@ -0,0 +1,77 @@
+import numpy as np
+
+
+def parse_price_range(price):
+    """
+    Parse a "1,000-2,000" style price string.
+
+    Returns:
+        (lower_bound, upper_bound) as ints, or None when the string has no range.
+
+    Raises:
+        ValueError: the string has a '-' but the bounds are not integers.
+    """
+    price = price.replace(',', '')
+    if "-" not in price:
+        return None
+    price_range = price.split('-')
+    return int(price_range[0]), int(price_range[1])
+
+
+class PriceIndex:
+    """
+    Numeric lower/upper price bounds of every catalog row.
+
+    Rows without a usable range have NaN bounds and never match; rows whose
+    `price` is set but could not be parsed are listed in `unparseable`.
+    """
+
+    def __init__(self, prices):
+        self.lower = np.full(len(prices), np.nan)
+        self.upper = np.full(len(prices), np.nan)
+        self.unparseable = []
+
+        for row, price in enumerate(prices):
+            if not price:
+                continue
+            try:
+                bounds = parse_price_range(price)
+            except (ValueError, IndexError):
+                bounds = None
+            if bounds is None:
+                self.unparseable.append((row, price))
+                continue
+            self.lower[row], self.upper[row] = bounds
+
+        if self.unparseable:
+            samples = ', '.join(f"'{price}'" for _, price in self.unparseable[:5])
+            print(f"Price index: {len(self.unparseable)} unparseable price ranges (e.g. {samples})")
+
+    def to_arrays(self):
+        return {'lower': self.lower, 'upper': self.upper}, {'unparseable': self.unparseable}
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        index = cls.__new__(cls)
+        index.lower = arrays['lower']
+        index.upper = arrays['upper']
+        index.unparseable = [tuple(item) for item in meta['unparseable']]
+        return index
+
+    def in_range_mask(self, user_price):
+        """
+        Boolean array, True for rows whose price range contains `user_price`.
+        """
+        try:
+            user_price = int(user_price)
+        except (TypeError, ValueError):
+            return np.zeros(len(self.lower), dtype=bool)
+        return (self.lower <= user_price) & (user_price <= self.upper)
+
+
+def build_price_index(snapshot):
+    return PriceIndex(snapshot.column("price"))
+
+
+def load_price_index(snapshot, arrays, meta):
+    return PriceIndex.from_arrays(arrays, meta)
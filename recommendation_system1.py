@@ -1,14 +1,81 @@
-import psycopg2
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
-import datetime
+import functools
+import os
+import time
 import jieba
 import numpy as np
+from cache import LRUCache, SingleFlight
+from db_pool import DatabasePool
+from restaurant_catalog import RestaurantCatalog
+from catalog_store import MappedRestaurantCatalog
+from opening_hours import build_opening_hours_index, load_opening_hours_index, parse_clock
+from price_index import build_price_index, load_price_index
+from location_index import build_location_index, load_location_index
+from scoring_index import TfidfScoringIndex, top_k
+from embedding_index import PreferenceEmbeddingIndex
+from metrics import COUNT_BUCKETS, REGISTRY
 
 class RecommendationSystem1:
-    def __init__(self, db_config, jieba_dict_path):
-        self.conn = psycopg2.connect(**db_config)
+    def __init__(self, db_config, jieba_dict_path, catalog_refresh_interval=60, updated_at_column=None,
+                 jieba_cache_dir=None, tokenize_cache_size=200000, db_pool=None, response_cache_size=4096,
+                 metrics=None, catalog_store=None, catalog_from_store=False, scoring='embedding',
+                 embedding_dimensions=128, catalog_full_reload_every=10, ranked_pages=5):
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.owns_pool = db_pool is None
+        self.db_pool = db_pool if db_pool is not None else DatabasePool(db_config)
+        self.startup_timings = {}
+
+        # 啟動時就載入 jieba 詞典，避免第一個請求才建 prefix dict；
+        # 詞典模型序列化在 jieba_cache_dir，worker 重啟時直接讀取
+        started = time.perf_counter()
         jieba.set_dictionary(jieba_dict_path)
+        if jieba_cache_dir:
+            os.makedirs(jieba_cache_dir, exist_ok=True)
+            jieba.dt.tmp_dir = jieba_cache_dir
+        jieba.initialize()
+        self.startup_timings['jieba_initialize'] = time.perf_counter() - started
+        self.cached_tokenize = functools.lru_cache(maxsize=tokenize_cache_size)(self.segment)
+
+        self.updated_at_column = updated_at_column
+        # 'embedding'：低維稠密向量評分；'tfidf'：原本的 TF-IDF 字詞重疊評分
+        self.scoring = scoring
+        self.embedding_dimensions = embedding_dimensions
+        index_builders = {
+            'opening_hours': build_opening_hours_index,
+            'price': build_price_index,
+            'location': build_location_index,
+            'tfidf': self.build_scoring_index,
+            'embedding': self.build_embedding_index,
+        }
+        if catalog_from_store:
+            # worker 直接映射其他行程匯出的 catalog，不查資料庫也不重建索引
+            self.catalog = MappedRestaurantCatalog(
+                catalog_store,
+                index_loaders={
+                    'opening_hours': load_opening_hours_index,
+                    'price': load_price_index,
+                    'location': load_location_index,
+                    'tfidf': self.load_scoring_index,
+                    'embedding': self.load_embedding_index,
+                },
+                index_builders=index_builders,
+                refresh_interval=catalog_refresh_interval,
+                metrics=self.metrics,
+            )
+        else:
+            self.catalog = RestaurantCatalog(
+                self.fetch_catalog_rows,
+                refresh_interval=catalog_refresh_interval,
+                updated_at_column=updated_at_column,
+                metrics=self.metrics,
+                index_builders=index_builders,
+                store=catalog_store,
+                full_reload_every=catalog_full_reload_every,
+                # delta 更新沿用已訓練的 TF-IDF 與 SVD，只處理新增或修改的餐廳；整表重載時才重新訓練
+                index_updaters={
+                    'tfidf': self.update_scoring_index,
+                    'embedding': self.update_embedding_index,
+                },
+            )
         self.food_categories = {
             "美式": ["美式", "漢堡", "薯條", "炸雞", "熱狗", "牛排", "沙拉", "烤肋排", "墨西哥捲餅", "橙汁雞翅", "燻煙熏肉", "炸魚薯條", "牛趴"],
             "日式": ["日式", "壽司", "拉麵", "烏冬麵", "天婦羅", "味噌湯", "刺身", "焼き鳥", "おでん", "鰻重", "とんかつ", "おにぎり"],
@@ -18,159 +85,400 @@ class RecommendationSystem1:
             "韓式": ["韓式", "烤肉", "泡菜", "石鍋拌飯", "韓式煎餅", "辣炒年糕", "韓式辣炒年糕", "韓式烤牛肉", "泡菜煎餅", "韓國炸雞"],
             "泰式": ["泰式", "冬陰功湯", "綠咖哩", "泰式炒河粉", "涼拌木瓜絲", "芒果糯米飯", "紅咖哩", "炒冷米粉", "泰式涼拌青木瓜", "炒辣肉碎", "香蕉椰奶飯"]
         }
+        self.stop_words = ["料", "理", "餐", "廳", "式", "國"]
+        # 品項 -> 所屬類別的品項清單，取代逐一掃描 food_categories（同一品項以先出現的類別為準）
+        self.category_lookup = {}
+        for items in self.food_categories.values():
+            for item in items:
+                self.category_lookup.setdefault(item, items)
+
+        # 正規化查詢 + catalog 版本 -> 推薦結果；相同查詢同時進來時只計算一次
+        # (snapshot 版本, 正規化查詢) -> 排好序的候選位置，各分頁直接切片，不必重新過濾與評分
+        self.response_cache = LRUCache(maxsize=response_cache_size)
+        # 第一次排序就排好 ranked_pages 頁，往後翻頁不用重算
+        self.ranked_pages = ranked_pages
+        self.single_flight = SingleFlight()
+        self.metrics.add_collector(self.collect_metrics)
+
+        started = time.perf_counter()
+        self.catalog.start()
+        self.startup_timings['catalog_load'] = time.perf_counter() - started
+        print("RecommendationSystem1 ready: " + ", ".join(
+            f"{stage} {seconds:.3f}s" for stage, seconds in self.startup_timings.items()))
 
     def __del__(self):
-        if self.conn:
-            self.conn.close()
-
-    def parse_opening_time(self, opening_time):
-        all_day_hours = []
-        for day_hours in opening_time.split(", "):
-            if day_hours.strip():
-                all_day_hours.append(day_hours.strip())
-        return all_day_hours
-
-    def is_open(self, hours_dict, day, time):
-        for hours in hours_dict:
-            the_day = hours[2]
-            if day == the_day:
-                if '休息' in hours:
-                    return False
-                else:
-                    time_periods = [period.strip() for period in hours[3:].split(' ') if period.strip()]
-                    for time_period in time_periods:
-                        try:
-                            if "–" in time_period:
-                                start, end = time_period.split('–')
-                            elif "-" in time_period:
-                                start, end = time_period.split('-')
-                            elif ("24" or "小時營業") in time_period: # 24 小時營業
-                                start = "00:00"
-                                end = "23:59"
-                            else:
-                                print(f"Unexpected time format: {time_period}")
-                                continue
-                            start_time = datetime.datetime.strptime(start.strip(), "%H:%M")
-                            end_time = datetime.datetime.strptime(end.strip(), "%H:%M")
-                            if start_time <= time <= end_time:
-                                return True
-                            else:
-                                continue
-                        except ValueError as e:
-                            print(f"Error parsing time period '{time_period}': {e}")
-                            continue
-        return False
-    
-    def price_in_range(self, price, user_price):
-        if price is None:
-            return False
-        price = price.replace(',', '')
-        if "-" in price:
-            try:
-                price_range = price.split('-')
-                lower_bound = int(price_range[0])
-                upper_bound = int(price_range[1])
-                return lower_bound <= int(user_price) <= upper_bound
-            except Exception as e:
-                print(f"Error parsing price range '{price}': {e}")
-                return False
-        return False
-
-    def get_restaurants(self):
-        cur = self.conn.cursor()
-        query = """
-            SELECT id, name, address, category, price, opening_time, rating, phone
-            FROM restaurant
-        """
-        cur.execute(query)
-        restaurants = cur.fetchall()
-        cur.close()
+        if getattr(self, 'catalog', None):
+            self.catalog.stop()
+        if getattr(self, 'owns_pool', False):
+            self.db_pool.close()
+
+    def get_restaurants(self, since_id=None, since_updated_at=None):
+        columns = "id, name, address, category, price, opening_time, rating, phone"
+        if self.updated_at_column:
+            columns += f", {self.updated_at_column}"
+        query = f"SELECT {columns} FROM restaurant"
+        params = []
+        if since_id is not None:
+            conditions = ["id > %s"]
+            params.append(since_id)
+            if self.updated_at_column and since_updated_at is not None:
+                conditions.append(f"{self.updated_at_column} > %s")
+                params.append(since_updated_at)
+            query += " WHERE " + " OR ".join(conditions)
+        query += " ORDER BY id"
+        with self.db_pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            restaurants = cur.fetchall()
+            cur.close()
         return restaurants
 
-    def tokenize(self, text):
+    def fetch_catalog_rows(self, since_id, since_updated_at):
+        """
+        Row source for the in-memory catalog: returns the restaurant rows and
+        the newest `updated_at_column` value among them (None when unused).
+        """
+        restaurants = self.get_restaurants(since_id, since_updated_at)
+        if not self.updated_at_column:
+            return restaurants, None
+        max_updated_at = max((row[8] for row in restaurants if row[8] is not None), default=None)
+        return [row[:8] for row in restaurants], max_updated_at
+
+    def reload_catalog(self):
+        return self.catalog.reload()
+
+    def collect_metrics(self):
+        snapshot = self.catalog.snapshot
+        opening_hours = snapshot.get_index('opening_hours')
+        price = snapshot.get_index('price')
+        samples = [
+            ('recommender_catalog_version', {}, snapshot.version),
+            ('recommender_catalog_restaurants', {}, len(snapshot)),
+            ('recommender_catalog_parse_errors', {'field': 'opening_time'},
+             len(opening_hours.parse_errors) if opening_hours else 0),
+            ('recommender_catalog_parse_errors', {'field': 'price'}, len(price.unparseable) if price else 0),
+        ]
+        for name, value in self.response_cache_stats().items():
+            samples.append(('recommender_response_cache', {'stat': name}, value))
+        tokenize = self.tokenize_cache_info()
+        samples.append(('recommender_tokenize_cache', {'stat': 'hits'}, tokenize.hits))
+        samples.append(('recommender_tokenize_cache', {'stat': 'misses'}, tokenize.misses))
+        samples.append(('recommender_tokenize_cache', {'stat': 'size'}, tokenize.currsize))
+        return samples
+
+    def segment(self, text):
         return ' '.join(jieba.cut(text))
 
+    def tokenize(self, text):
+        # 餐廳名稱與常見查詢詞重複率高，以有上限的 LRU 快取斷詞結果
+        return self.cached_tokenize(text)
+
+    def tokenize_cache_info(self):
+        return self.cached_tokenize.cache_info()
+
     def get_category_items(self, cuisine_type):
-        for category, items in self.food_categories.items():
-            if cuisine_type in items:
-                return items
-        return []
+        return self.category_lookup.get(cuisine_type, [])
+
+    def scoring_document(self, restaurant):
+        return f"{restaurant[1]} {restaurant[3]}"
+
+    def build_scoring_index(self, snapshot):
+        documents = [self.scoring_document(restaurant) for restaurant in snapshot.rows]
+        return TfidfScoringIndex(documents, self.tokenize, self.stop_words)
+
+    def update_scoring_index(self, snapshot, previous, reused):
+        if previous.matrix is None:
+            return self.build_scoring_index(snapshot)
+        documents = [self.scoring_document(restaurant)
+                     for restaurant, position in zip(snapshot.rows, reused) if position < 0]
+        return previous.updated(reused, documents)
 
-    def enhance_with_user_preferences(self, recommended_restaurants, user_preferences, cuisine_type):
-        preference_texts = [' '.join(user_preferences)]
+    def load_scoring_index(self, snapshot, arrays, meta):
+        return TfidfScoringIndex.from_arrays(arrays, meta, self.tokenize, self.stop_words)
+
+    def build_embedding_index(self, snapshot):
+        if self.scoring != 'embedding':
+            return None
+        category_texts = [' '.join(items) for items in self.food_categories.values()]
+        return PreferenceEmbeddingIndex(snapshot.get_index('tfidf'), category_texts,
+                                        lookup_texts=list(self.category_lookup), dimensions=self.embedding_dimensions)
+
+    def update_embedding_index(self, snapshot, previous, reused):
+        scoring_index = snapshot.get_index('tfidf')
+        if (self.scoring != 'embedding' or not previous.available
+                or scoring_index.vectorizer is not previous.scoring_index.vectorizer):
+            return self.build_embedding_index(snapshot)
+        return previous.updated(scoring_index, reused)
+
+    def load_embedding_index(self, snapshot, arrays, meta):
+        return PreferenceEmbeddingIndex.from_arrays(arrays, meta, snapshot.get_index('tfidf'))
+
+    def preference_query_texts(self, user_preferences, cuisine_type):
+        preference_texts = [' '.join(user_preferences or [])]
         category_items = self.get_category_items(cuisine_type) if cuisine_type else []
         category_texts = [' '.join(category_items)]
-        cuisine_type_texts = [cuisine_type] if cuisine_type else []
+        cuisine_type_texts = [cuisine_type or '']
+        return preference_texts + category_texts + cuisine_type_texts
 
-        vectorizer = TfidfVectorizer(stop_words=["料", "理", "餐", "廳", "式", "國"], tokenizer=self.tokenize)
-        combined_texts = preference_texts + category_texts + cuisine_type_texts
-        combined_matrix = vectorizer.fit_transform(combined_texts)
+    def preference_weights(self, cuisine_type):
+        # 根據有無 cuisine_type 調整權重 (user_preference, category, cuisine_type)
+        if cuisine_type:
+            return np.array([0.2, 0.2, 0.6])
+        return np.array([1.0, 0.0, 0.0])
 
-        user_preference_vector = combined_matrix[0]
-        category_vector = combined_matrix[1] if category_items else None
-        cuisine_type_vector = combined_matrix[2] if cuisine_type else None
+    def rank(self, snapshot, positions, preference_scores, limit=None, offset=0):
+        # 只排序需要回傳的前 offset + limit 筆
+        k = None if limit is None else offset + limit
+        return snapshot.take(self.rank_positions(positions, preference_scores, k)[offset:])
 
-        preference_scores = []
-        for restaurant in recommended_restaurants:
-            restaurant_text = f"{restaurant[1]} {restaurant[3]}"
-            restaurant_vector = vectorizer.transform([restaurant_text])
+    def rank_positions(self, positions, preference_scores, depth=None):
+        """
+        Catalog positions of the `depth` best scored candidates (all of them when None), best first.
+        """
+        return np.asarray(positions)[top_k(preference_scores, depth)]
 
-            # 計算相似度，只在 vector 存在時才計算
-            if cuisine_type_vector is not None:
-                cuisine_similarity = linear_kernel(cuisine_type_vector, restaurant_vector).flatten()[0]
-            else:
-                cuisine_similarity = 0
-            
-            user_preference_similarity = linear_kernel(user_preference_vector, restaurant_vector).flatten()[0]
-            
-            if category_vector is not None:
-                category_similarity = linear_kernel(category_vector, restaurant_vector).flatten()[0]
-            else:
-                category_similarity = 0
+    def score_preferences(self, snapshot, positions, queries):
+        """
+        Preference scores of the catalog rows at `positions` for several queries at once.
 
-            # 根據有無 cuisine_type 調整權重
-            if cuisine_type:
-                score = (cuisine_similarity * 0.6) + (user_preference_similarity * 0.2) + (category_similarity * 0.2)
-            else:
-                score = user_preference_similarity
-            
-            preference_scores.append(score)
+        Parameters:
+            queries (list): (user_preferences, cuisine_type) pairs.
 
-        sorted_indices = np.argsort(preference_scores)[::-1]
-        enhanced_recommendations = [recommended_restaurants[idx] for idx in sorted_indices]
+        Returns:
+            scores (ndarray): shape (len(positions), len(queries)).
+        """
+        return self.score_query_texts(snapshot, positions, [
+            (self.preference_query_texts(user_preferences, cuisine_type), self.preference_weights(cuisine_type))
+            for user_preferences, cuisine_type in queries
+        ])
 
-        return enhanced_recommendations
+    def score_query_texts(self, snapshot, positions, queries):
+        """
+        score_preferences for queries already turned into texts.
 
-    def recommend_restaurants(self, location, cuisine_type, price_range, dining_day, dining_hour, user_preferences):
-        restaurants = self.get_restaurants()
+        Parameters:
+            queries (list): (preference_query_texts, preference_weights) pairs.
 
-        # 處理 dining_hour
-        if dining_hour:
-            dining_time = datetime.datetime.strptime(dining_hour, "%H:%M")
-        else:
-            dining_time = None
+        Returns:
+            scores (ndarray): shape (len(positions), len(queries)).
+        """
+        embedding_index = snapshot.get_index('embedding') if self.scoring == 'embedding' else None
+        if embedding_index is not None and embedding_index.available:
+            # 三段查詢文字先依權重合成一個向量，評分只剩一次稠密矩陣與向量的乘法
+            with self.metrics.timer('query_vectorize'):
+                query_vectors = np.stack([
+                    weights.astype(np.float32) @ embedding_index.embed(texts) for texts, weights in queries
+                ])
+            with self.metrics.timer('score'):
+                return embedding_index.scores(query_vectors, positions)
 
-        open_restaurants = []
-        for restaurant in restaurants:
-            # location 為 null 時，不過濾位置
-            if location and location.lower() not in restaurant[2].lower():
-                continue
+        # 以整份餐廳語料預先訓練的 TF-IDF，一次矩陣乘法算出所有候選餐廳的相似度
+        scoring_index = snapshot.get_index('tfidf')
+        with self.metrics.timer('query_vectorize'):
+            query_matrix = scoring_index.transform([text for texts, _ in queries for text in texts])
+        with self.metrics.timer('score'):
+            similarities = scoring_index.scores(query_matrix, positions)
+            weights = np.zeros((3 * len(queries), len(queries)))
+            for number, (_, query_weights) in enumerate(queries):
+                weights[3 * number:3 * number + 3, number] = query_weights
+            return similarities @ weights
 
-            # 當 price_range 為 -1 時，不過濾價格範圍
-            if price_range != -1 and not self.price_in_range(restaurant[4], price_range):
-                continue
-            
+    def enhance_with_user_preferences(self, snapshot, positions, user_preferences, cuisine_type, limit=None, offset=0):
+        preference_scores = self.score_preferences(snapshot, positions, [(user_preferences, cuisine_type)])[:, 0]
+
+        with self.metrics.timer('rank'):
+            return self.rank(snapshot, positions, preference_scores, limit, offset)
+
+    def filter_restaurants(self, snapshot, location, price_range, dining_day, dining_hour):
+        """
+        Catalog positions (ascending) of the restaurants passing every filter.
+        """
+        metrics = self.metrics
+        # None 代表整份 catalog 都還是候選
+        candidates = None
+
+        # location 為 null 時，不過濾位置；否則由地址索引直接取得候選餐廳
+        if location:
+            with metrics.timer('filter.location'):
+                candidates = snapshot.get_index('location').lookup(location)
+            metrics.observe('recommender_filter_candidates', len(candidates), COUNT_BUCKETS, filter='location')
 
-            if dining_day and dining_time :
-                hours_dict = self.parse_opening_time(restaurant[5])
-                if not self.is_open(hours_dict, dining_day, dining_time):
-                    continue
-            
-            open_restaurants.append(restaurant)
+        # 營業時間以預先編譯的索引一次過濾
+        if dining_day and dining_hour:
+            with metrics.timer('filter.opening_hours'):
+                open_mask = snapshot.get_index('opening_hours').open_mask(dining_day, dining_hour)
+                candidates = np.flatnonzero(open_mask) if candidates is None else candidates[open_mask[candidates]]
+            metrics.observe('recommender_filter_candidates', len(candidates), COUNT_BUCKETS, filter='opening_hours')
 
-        if not open_restaurants:
+        # 當 price_range 為 -1 時，不過濾價格範圍
+        if price_range != -1:
+            with metrics.timer('filter.price'):
+                price_mask = snapshot.get_index('price').in_range_mask(price_range)
+                candidates = np.flatnonzero(price_mask) if candidates is None else candidates[price_mask[candidates]]
+            metrics.observe('recommender_filter_candidates', len(candidates), COUNT_BUCKETS, filter='price')
+
+        if candidates is None:
+            return np.arange(len(snapshot))
+        return candidates
+
+    def normalize_query(self, location, cuisine_type, price_range, dining_day, dining_hour, user_preferences):
+        """
+        Hashable cache key for a query: location lower-cased, preferences sorted,
+        dining_hour reduced to its minute of the day. None when the query cannot be keyed.
+        """
+        try:
+            minute = parse_clock(dining_hour) if dining_hour else None
+            preferences = tuple(sorted(user_preferences)) if user_preferences else ()
+            key = (location.lower() if location else None, cuisine_type, price_range, dining_day, minute, preferences)
+            hash(key)
+        except (AttributeError, TypeError, ValueError):
+            return None
+        return key
+
+    def recommend_restaurants(self, location, cuisine_type, price_range, dining_day, dining_hour, user_preferences, limit=None, offset=0):
+        snapshot = self.catalog.snapshot
+
+        def rank_candidates(depth):
+            open_positions = self.filter_restaurants(snapshot, location, price_range, dining_day, dining_hour)
+            if len(open_positions) == 0:
+                return open_positions
+
+            preference_scores = self.score_preferences(
+                snapshot, open_positions, [(user_preferences, cuisine_type)])[:, 0]
+            with self.metrics.timer('rank'):
+                return self.rank_positions(open_positions, preference_scores, depth)
+
+        # 只快取有分頁上限的結果，避免佔用無上限的記憶體
+        query = self.normalize_query(location, cuisine_type, price_range, dining_day, dining_hour, user_preferences)
+        if limit is not None and limit <= 0:
             return []
+        if query is None or limit is None:
+            return snapshot.take(rank_candidates(None if limit is None else offset + limit)[offset:])
+
+        return self.cached_page(snapshot, (snapshot.version, query), limit, offset, rank_candidates)
+
+    def cached_page(self, snapshot, key, limit, offset, rank_candidates):
+        """
+        Restaurants [offset, offset + limit) of a query's ranking, ranked once per query and
+        snapshot version and sliced for every page.
+
+        Parameters:
+            key (tuple): (snapshot version, normalized query).
+            rank_candidates (callable): rank_candidates(depth) -> catalog positions of the `depth`
+                best candidates, best first (fewer when the candidates run out).
+        """
+        needed = offset + limit
+        ranking = self.response_cache.get(key)
+        # ranking 為 (排序後位置, 排序時要求的深度)；位置不足深度代表候選已全部排入
+        hit = ranking is not None and ranking[1] >= needed
+        self.metrics.increment('recommender_response_cache_lookups_total', result='hit' if hit else 'miss')
+        if not hit:
+            depth = max(needed, limit * self.ranked_pages)
+            if ranking is not None:
+                depth = max(depth, 2 * ranking[1])
+
+            def compute_and_store():
+                result = (rank_candidates(depth), depth)
+                self.response_cache.set(key, result)
+                return result
+            ranking = self.single_flight.do((key, depth), compute_and_store)
+
+        return snapshot.take(ranking[0][offset:needed])
+
+    def recommend_for_group(self, location, price_range, dining_day, dining_hour, preference_vector, limit=None, offset=0):
+        """
+        recommend_restaurants for a chatroom's group preference vector instead of one user's preferences.
+
+        Every item with a positive group weight is scored as if queried with
+        user_preferences=[item] and cuisine_type=item, all items in a single
+        score_preferences pass, and the item scores are summed with the group weights.
+
+        Parameters:
+            preference_vector (dict | Series): item -> group weight, see FindLeader.group_profile.
+        """
+        snapshot = self.catalog.snapshot
+        items = [(item, float(weight)) for item, weight in dict(preference_vector).items() if weight > 0]
+
+        def rank_candidates(depth):
+            open_positions = self.filter_restaurants(snapshot, location, price_range, dining_day, dining_hour)
+            if len(open_positions) == 0:
+                return open_positions
 
-        enhanced_recommendations = self.enhance_with_user_preferences(open_restaurants, user_preferences, cuisine_type)
+            if items:
+                item_scores = self.score_preferences(snapshot, open_positions, [([item], item) for item, _ in items])
+                group_scores = item_scores @ np.array([weight for _, weight in items], dtype=item_scores.dtype)
+            else:
+                group_scores = np.zeros(len(open_positions))
+
+            with self.metrics.timer('rank'):
+                return self.rank_positions(open_positions, group_scores, depth)
+
+        query = self.normalize_query(location, None, price_range, dining_day, dining_hour, None)
+        if limit is not None and limit <= 0:
+            return []
+        if query is None or limit is None:
+            return snapshot.take(rank_candidates(None if limit is None else offset + limit)[offset:])
+
+        group = tuple((item, round(weight, 9)) for item, weight in items)
+        return self.cached_page(snapshot, (snapshot.version, query, group), limit, offset, rank_candidates)
+
+    def response_cache_stats(self):
+        stats = self.response_cache.stats()
+        stats['coalesced'] = self.single_flight.coalesced
+        return stats
+
+    def recommend_restaurants_batch(self, queries, limit=None):
+        """
+        Run several recommend_restaurants queries against one catalog snapshot.
+
+        Every query is filtered separately, then all of them are scored with
+        one matrix product over the union of their candidates.
+
+        Parameters:
+            queries (list): dicts with recommend_restaurants' arguments (location, cuisine_type,
+                price_range, dining_day, dining_hour, user_preferences) and an optional offset.
+            limit (int): page size applied to every query.
+
+        Returns:
+            results (list): one (restaurants, error) tuple per query; error is None on success.
+        """
+        snapshot = self.catalog.snapshot
+
+        candidates = []
+        for query in queries:
+            try:
+                positions = self.filter_restaurants(
+                    snapshot, query['location'], query['price_range'], query['dining_day'], query['dining_hour'])
+                # 查詢文字也在這裡建立，格式錯誤的查詢只影響自己那一筆
+                texts = (self.preference_query_texts(query['user_preferences'], query['cuisine_type']),
+                         self.preference_weights(query['cuisine_type']))
+                candidates.append((positions, texts, None))
+            except Exception as e:
+                candidates.append((None, None, e))
+
+        # 只有通過過濾且有候選餐廳的查詢參與共用的評分，columns 記錄各查詢在分數矩陣中的欄
+        columns = {}
+        scored = []
+        for number, (positions, texts, error) in enumerate(candidates):
+            if error is None and len(positions):
+                columns[number] = len(scored)
+                scored.append((positions, texts))
+        if scored and not (limit is not None and limit <= 0):
+            union = np.unique(np.concatenate([positions for positions, _ in scored]))
+            scores = self.score_query_texts(snapshot, union, [texts for _, texts in scored])
+        else:
+            union = scores = None
+
+        results = []
+        for number, (query, (positions, _, error)) in enumerate(zip(queries, candidates)):
+            if error is not None:
+                results.append(([], error))
+                continue
+            if union is None or len(positions) == 0:
+                results.append(([], None))
+                continue
+            rows = np.searchsorted(union, positions)
+            preference_scores = scores[rows, columns[number]]
+            results.append((self.rank(snapshot, positions, preference_scores, limit, query.get('offset', 0)), None))
 
-        return enhanced_recommendations
+        return results
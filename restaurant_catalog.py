@@ -0,0 +1,191 @@
+import contextlib
+import threading
+import time
+
+import numpy as np
+
+RESTAURANT_COLUMNS = ("id", "name", "address", "category", "price", "opening_time", "rating", "phone")
+
+
+class CatalogSnapshot:
+    """
+    An immutable view of the restaurant table.
+
+    Rows keep the same tuple layout as `SELECT id, name, address, category,
+    price, opening_time, rating, phone FROM restaurant`, so callers can keep
+    indexing them positionally.
+    """
+
+    def __init__(self, rows, version, watermark=None, indexes=None):
+        self.rows = tuple(rows)
+        self.version = version
+        self.watermark = watermark
+        self.indexes = indexes if indexes is not None else {}
+        self.loaded_at = time.time()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, name):
+        position = RESTAURANT_COLUMNS.index(name)
+        return [row[position] for row in self.rows]
+
+    def take(self, positions):
+        return [self.rows[position] for position in positions]
+
+    def get_index(self, name):
+        return self.indexes.get(name)
+
+
+class RestaurantCatalog:
+    """
+    Keeps the restaurant table in memory and refreshes it in the background.
+
+    A full scan is done once at startup; afterwards only rows past the last
+    seen id (or, when `updated_at_column` is set, rows modified after the last
+    seen timestamp) are fetched and merged into a new snapshot. Deltas cannot
+    see deleted rows, and without `updated_at_column` they miss edits too, so
+    every `full_reload_every`-th tick does a full reload instead. Readers grab
+    `catalog.snapshot` once per request and keep using it even if a refresh
+    swaps in a newer one meanwhile.
+    """
+
+    def __init__(self, fetch_rows, refresh_interval=60, updated_at_column=None, index_builders=None, metrics=None,
+                 store=None, full_reload_every=10, index_updaters=None):
+        """
+        Parameters:
+            fetch_rows (callable): fetch_rows(since_id, since_updated_at) -> (rows, max_updated_at).
+                Both arguments are None for a full load.
+            refresh_interval (float): Seconds between background delta refreshes, None or 0 disables it.
+            updated_at_column (str): Optional timestamp column used to pick up modified rows.
+            index_builders (dict): name -> callable(snapshot) building a derived structure for each snapshot.
+            metrics (MetricsRegistry): Optional registry timing fetches and index builds.
+            store (CatalogStore): Optional store every new snapshot is exported to, for MappedRestaurantCatalog readers.
+            full_reload_every (int): Background ticks per full reload (picks up deletes and, without
+                `updated_at_column`, edits); None or 0 only ever runs delta refreshes.
+            index_updaters (dict): name -> callable(snapshot, previous_index, reused) deriving an index from
+                the previous snapshot's on delta refreshes, where reused[i] is row i's position in the
+                previous snapshot or -1 when it was added or modified. Full reloads always use index_builders.
+        """
+        self.fetch_rows = fetch_rows
+        self.refresh_interval = refresh_interval
+        self.updated_at_column = updated_at_column
+        self.index_builders = dict(index_builders or {})
+        self.index_updaters = dict(index_updaters or {})
+        self.metrics = metrics
+        self.store = store
+        self.full_reload_every = full_reload_every
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._version = 0
+        self.snapshot = CatalogSnapshot((), version=0)
+
+    def start(self):
+        self.reload()
+        if self.refresh_interval and self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name="restaurant-catalog-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _refresh_loop(self):
+        ticks = 0
+        while not self._stop.wait(self.refresh_interval):
+            ticks += 1
+            try:
+                # delta 查詢看不到被刪除的列，定期整表重載讓刪除與修改收斂
+                if self.full_reload_every and ticks % self.full_reload_every == 0:
+                    self.reload()
+                else:
+                    self.refresh()
+            except Exception as e:
+                print(f"Error refreshing restaurant catalog: {e}")
+
+    def reload(self):
+        """
+        Replace the snapshot with a full scan of the table.
+        """
+        with self._lock:
+            with self._timer('catalog.fetch'):
+                rows, max_updated_at = self.fetch_rows(None, None)
+            max_id = max((row[0] for row in rows), default=None)
+            self._swap(rows, (max_id, max_updated_at))
+            return self.snapshot
+
+    def refresh(self):
+        """
+        Merge rows inserted (or updated) since the last load into a new snapshot.
+
+        Returns:
+            changed (int): number of rows fetched by the delta query.
+        """
+        with self._lock:
+            current = self.snapshot
+            since_id, since_updated_at = current.watermark or (None, None)
+            if since_id is None:
+                rows, max_updated_at = self.fetch_rows(None, None)
+                self._swap(rows, (max((row[0] for row in rows), default=None), max_updated_at))
+                return len(rows)
+
+            with self._timer('catalog.fetch_delta'):
+                delta, max_updated_at = self.fetch_rows(since_id, since_updated_at if self.updated_at_column else None)
+            if not delta:
+                return 0
+
+            merged = {row[0]: row for row in current.rows}
+            for row in delta:
+                merged[row[0]] = row
+            rows = sorted(merged.values(), key=lambda row: row[0])
+
+            # 沒變的列記下在舊 snapshot 的位置，index_updaters 只需處理新增與修改的列
+            previous_positions = {row[0]: position for position, row in enumerate(current.rows)}
+            reused = np.full(len(rows), -1, dtype=np.int64)
+            for position, row in enumerate(rows):
+                previous_position = previous_positions.get(row[0])
+                if previous_position is not None and current.rows[previous_position] == row:
+                    reused[position] = previous_position
+
+            max_id = max(since_id, max(row[0] for row in delta))
+            if max_updated_at is None:
+                max_updated_at = since_updated_at
+            elif since_updated_at is not None:
+                max_updated_at = max(max_updated_at, since_updated_at)
+            self._swap(rows, (max_id, max_updated_at), previous=current, reused=reused)
+            return len(delta)
+
+    def _timer(self, stage):
+        if self.metrics is None:
+            return contextlib.nullcontext()
+        return self.metrics.timer(stage)
+
+    def _build(self, rows, watermark, previous=None, reused=None):
+        self._version += 1
+        snapshot = CatalogSnapshot(rows, version=self._version, watermark=watermark)
+        for name, build in self.index_builders.items():
+            update = self.index_updaters.get(name)
+            previous_index = previous.get_index(name) if previous is not None else None
+            with self._timer(f'catalog.index.{name}'):
+                if update is not None and previous_index is not None:
+                    snapshot.indexes[name] = update(snapshot, previous_index, reused)
+                else:
+                    snapshot.indexes[name] = build(snapshot)
+        return snapshot
+
+    def _swap(self, rows, watermark, previous=None, reused=None):
+        snapshot = self._build(rows, watermark, previous, reused)
+        # 單一屬性賦值是原子操作，進行中的請求仍持有舊的 snapshot
+        self.snapshot = snapshot
+
+        if self.store is not None:
+            try:
+                with self._timer('catalog.export'):
+                    self.store.export(snapshot)
+            except Exception as e:
+                print(f"Error exporting restaurant catalog: {e}")
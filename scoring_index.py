@@ -0,0 +1,106 @@
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+class TfidfScoringIndex:
+    """
+    TF-IDF vectors of every catalog row ("name category"), fitted once per snapshot.
+
+    Rows are L2-normalised, so the product with a query vector is the same
+    cosine similarity `linear_kernel` used to compute one restaurant at a time.
+    """
+
+    def __init__(self, documents, tokenizer, stop_words):
+        self.vectorizer = TfidfVectorizer(stop_words=stop_words, tokenizer=tokenizer)
+        self.size = len(documents)
+        if documents:
+            self.matrix = self.vectorizer.fit_transform(documents).tocsr()
+        else:
+            self.matrix = None
+
+    def to_arrays(self):
+        """
+        CSR components, idf weights and vocabulary, enough to rebuild the fitted index without refitting.
+        """
+        arrays = {'idf': self.vectorizer.idf_} if self.matrix is not None else {}
+        if self.matrix is not None:
+            arrays.update(data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr)
+        vocabulary = {term: int(column) for term, column in getattr(self.vectorizer, 'vocabulary_', {}).items()}
+        meta = {'size': self.size, 'vocabulary': vocabulary}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta, tokenizer, stop_words):
+        index = cls.__new__(cls)
+        index.size = meta['size']
+        if 'idf' not in arrays:
+            index.vectorizer = TfidfVectorizer(stop_words=stop_words, tokenizer=tokenizer)
+            index.matrix = None
+            return index
+
+        # 以固定詞彙表重建 vectorizer，再填回訓練時的 idf，transform 結果與原本的 fit 相同
+        index.vectorizer = TfidfVectorizer(stop_words=stop_words, tokenizer=tokenizer, vocabulary=meta['vocabulary'])
+        index.vectorizer.idf_ = np.asarray(arrays['idf'])
+        index.matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                         shape=(meta['size'], len(meta['vocabulary'])), copy=False)
+        return index
+
+    def updated(self, reused, documents):
+        """
+        An index over a changed catalog that keeps this index's vocabulary and idf weights.
+
+        Parameters:
+            reused (ndarray): for every row of the new catalog, its row in this index, or -1 for
+                rows that were added or modified.
+            documents (list): documents of the -1 rows, in order; only these are tokenized.
+        """
+        index = self.__class__.__new__(self.__class__)
+        # 沿用已訓練的 vectorizer：不重新斷詞整份 catalog，其他餐廳的 idf 也不會因新增一筆而改變
+        index.vectorizer = self.vectorizer
+        index.size = len(reused)
+        reused = np.asarray(reused)
+        fresh = reused < 0
+        rows = reused.copy()
+        rows[fresh] = self.matrix.shape[0] + np.arange(np.count_nonzero(fresh))
+        stacked = sparse.vstack([self.matrix, self.vectorizer.transform(documents)]).tocsr() if documents else self.matrix
+        index.matrix = stacked[rows]
+        return index
+
+    def transform(self, texts):
+        return self.vectorizer.transform(texts)
+
+    def scores(self, query_matrix, positions=None):
+        """
+        Parameters:
+            query_matrix (sparse matrix): one TF-IDF query vector per row, from `transform`.
+            positions (array): catalog rows to score, all rows when None.
+
+        Returns:
+            scores (ndarray): shape (len(positions), n_queries).
+        """
+        if self.matrix is None:
+            count = self.size if positions is None else len(positions)
+            return np.zeros((count, query_matrix.shape[0]))
+        rows = self.matrix if positions is None else self.matrix[positions]
+        return np.asarray((rows @ query_matrix.T).todense())
+
+
+def top_k(scores, k):
+    """
+    Indices of the `k` highest scores, best first; ties keep their original order.
+
+    Uses a partial partition so only the selected entries are sorted.
+    """
+    count = len(scores)
+    if k is None or k >= count:
+        chosen = np.arange(count)
+    elif k <= 0:
+        return np.empty(0, dtype=np.intp)
+    else:
+        kth_score = np.partition(scores, count - k)[count - k]
+        greater = np.flatnonzero(scores > kth_score)
+        ties = np.flatnonzero(scores == kth_score)[:k - len(greater)]
+        chosen = np.concatenate([greater, ties])
+    order = np.lexsort((chosen, -scores[chosen]))
+    return chosen[order][:k]
@@ -0,0 +1,91 @@
+"""
+The incrementally maintained chatroom state must give the same leader,
+member order and influenced ratings as the from-scratch influenced_rating,
+whatever order members joined and left in.
+
+    python -m pytest tests
+"""
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from find_leader import FindLeader
+from metrics import MetricsRegistry
+
+ITEMS = [f"item_{number}" for number in range(8)]
+
+
+def make_find_leader():
+    # db_pool 不會被用到，分析只走記憶體中的資料
+    return FindLeader({}, db_pool=object(), metrics=MetricsRegistry())
+
+
+def random_ratings(rng):
+    kind = rng.random()
+    if kind < 0.15:
+        # 全部同分：PCC 為 nan
+        return [rng.randint(1, 5)] * len(ITEMS)
+    if kind < 0.2:
+        # 沒有評分：trust 為 nan
+        return [0] * len(ITEMS)
+    return [rng.choice([0, 1, 2, 3, 4, 5]) for _ in ITEMS]
+
+
+def preference_rows(members, rng):
+    """
+    Members' rows with a 'user_id' column, shuffled as a query could return them.
+    """
+    group = pd.DataFrame([[user_id, *ratings] for user_id, ratings in members.items()],
+                         columns=['user_id', *ITEMS])
+    return group.sample(frac=1, random_state=rng.randrange(2 ** 32)).reset_index(drop=True)
+
+
+def assert_same_analysis(find_leader, chatroom_id, group):
+    leader_id, influenced, sorted_ids = find_leader.influenced_preferences(chatroom_id, group)
+    expected_leader, expected_influenced, expected_sorted = find_leader.influenced_rating(group.set_index('user_id'))
+
+    assert leader_id == expected_leader
+    assert sorted_ids == expected_sorted
+    np.testing.assert_allclose(influenced.loc[expected_influenced.index].to_numpy(),
+                               expected_influenced.to_numpy(), rtol=1e-9, atol=1e-9)
+    assert (find_leader.calculate_opinion_weight(sorted_ids)
+            == find_leader.calculate_opinion_weight(expected_sorted))
+
+
+def test_uniform_member_after_leave():
+    find_leader = make_find_leader()
+    rng = random.Random(0)
+    members = {
+        'a': [5, 1, 0, 3, 4, 2, 0, 1],
+        'b': [4, 2, 1, 3, 5, 0, 2, 1],
+        'c': [2] * len(ITEMS),
+        'd': [1, 5, 3, 0, 2, 4, 4, 3],
+    }
+    assert_same_analysis(find_leader, 1, preference_rows(members, rng))
+
+    del members['a']
+    assert_same_analysis(find_leader, 1, preference_rows(members, rng))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_incremental_matches_from_scratch(seed):
+    find_leader = make_find_leader()
+    rng = random.Random(seed)
+    next_user = 0
+    members = {}
+    for _ in range(rng.randint(2, 6)):
+        members[f"user_{next_user:03d}"] = random_ratings(rng)
+        next_user += 1
+    assert_same_analysis(find_leader, seed, preference_rows(members, rng))
+
+    for _ in range(30):
+        action = rng.random()
+        if action < 0.35 or len(members) < 3:
+            members[f"user_{rng.randrange(1000):03d}"] = random_ratings(rng)
+        elif action < 0.7:
+            del members[rng.choice(sorted(members))]
+        else:
+            members[rng.choice(sorted(members))] = random_ratings(rng)
+        assert_same_analysis(find_leader, seed, preference_rows(members, rng))